@@ -6,11 +6,13 @@ import asyncio
 import logging
 import uuid
 import io
+from collections import deque
 from itertools import count
 
 from . import constants as amqp_constants
 from . import frame as amqp_frame
 from . import exceptions
+from .compat import ensure_future
 from .envelope import Envelope
 
 
@@ -21,6 +23,11 @@ def chunker(seq, size):
     return [seq[i:size+i] for i in range(0, len(seq), size)]
 
 
+def _expire_future(fut):
+    if not fut.done():
+        fut.set_exception(asyncio.TimeoutError())
+
+
 class Channel:
 
     def __init__(self, protocol, channel_id):
@@ -29,15 +36,25 @@ class Channel:
         self.channel_id = channel_id
         self.consumer_queues = {}
         self.consumer_callbacks = {}
+        self.consumer_body_allocators = {}
+        self.consumer_ack_timeouts = {}
         self.response_future = None
         self.close_event = asyncio.Event(loop=self._loop)
         self.cancelled_consumers = set()
         self.last_consumer_tag = None
         self.publisher_confirms = False
         self.delivery_tag_iter = None  # used for mapping delivered messages to publisher confirms
+        self._confirm_floor = 1  # publishes below were all confirmed by a `multiple` ack or nack
 
         self._futures = {}
         self._ctag_events = {}
+        # basic.get responses come back in order, each resolves the oldest waiter
+        self._basic_get_waiters = deque()
+        self._basic_get_ids = count()
+        # delivery tag -> TimerHandle of the ack deadline of the delivery
+        self._ack_deadlines = {}
+        # the deliveries requeued once their deadline expired, their acks are dropped
+        self._expired_deliveries = set()
 
     def _set_waiter(self, rpc_name):
         if rpc_name in self._futures:
@@ -70,6 +87,11 @@ class Channel:
                 exception = exceptions.ChannelClosed(**kwargs)
             future.set_exception(exception)
 
+        self._basic_get_waiters.clear()
+        for handle in self._ack_deadlines.values():
+            handle.cancel()
+        self._ack_deadlines.clear()
+        self._expired_deliveries.clear()
         self.protocol.release_channel_id(self.channel_id)
         self.close_event.set()
 
@@ -110,6 +132,13 @@ class Channel:
             raise NotImplementedError("Frame (%s, %s) is not implemented" % (frame.class_id, frame.method_id))
         yield from methods[(frame.class_id, frame.method_id)](frame)
 
+    @asyncio.coroutine
+    def _ensure_open(self):
+        """Raise like _write_frame() if the connection or the channel is closed"""
+        yield from self.protocol.ensure_open()
+        if not self.is_open:
+            raise exceptions.ChannelClosed()
+
     @asyncio.coroutine
     def _write_frame(self, frame, request, check_open=True, drain=True):
         yield from self.protocol.ensure_open()
@@ -117,7 +146,7 @@ class Channel:
             raise exceptions.ChannelClosed()
         frame.write_frame(request)
         if drain:
-            yield from self.protocol._drain()
+            yield from self.protocol._drain(self.channel_id)
 
     @asyncio.coroutine
     def _write_frame_awaiting_response(self, waiter_id, frame, request, no_wait, check_open=True, drain=True):
@@ -197,6 +226,8 @@ class Channel:
             'class_id': frame.payload_decoder.read_short(),
             'method_id': frame.payload_decoder.read_short(),
         }
+        if self.protocol.topology_cache is not None:
+            self.protocol.topology_cache.clear()
         self.connection_closed(results['reply_code'], results['reply_text'])
 
     @asyncio.coroutine
@@ -227,6 +258,12 @@ class Channel:
     @asyncio.coroutine
     def exchange_declare(self, exchange_name, type_name, passive=False, durable=False,
                          auto_delete=False, no_wait=False, arguments=None):
+        cache = None if passive else self.protocol.topology_cache
+        if cache is not None:
+            yield from self._ensure_open()
+            if cache.has_exchange(exchange_name, type_name, durable, auto_delete, arguments):
+                return True
+
         frame = amqp_frame.AmqpRequest(self.protocol._stream_writer, amqp_constants.TYPE_METHOD, self.channel_id)
         frame.declare_method(
             amqp_constants.CLASS_EXCHANGE, amqp_constants.EXCHANGE_DECLARE)
@@ -240,8 +277,11 @@ class Channel:
         request.write_bits(passive, durable, auto_delete, internal, no_wait)
         request.write_table(arguments)
 
-        return (yield from self._write_frame_awaiting_response(
-            'exchange_declare', frame, request, no_wait))
+        result = yield from self._write_frame_awaiting_response(
+            'exchange_declare', frame, request, no_wait)
+        if cache is not None and not no_wait:
+            cache.add_exchange(exchange_name, type_name, durable, auto_delete, arguments)
+        return result
 
     @asyncio.coroutine
     def exchange_declare_ok(self, frame):
@@ -252,6 +292,8 @@ class Channel:
 
     @asyncio.coroutine
     def exchange_delete(self, exchange_name, if_unused=False, no_wait=False):
+        if self.protocol.topology_cache is not None:
+            self.protocol.topology_cache.remove_exchange(exchange_name)
         frame = amqp_frame.AmqpRequest(self.protocol._stream_writer, amqp_constants.TYPE_METHOD, self.channel_id)
         frame.declare_method(
             amqp_constants.CLASS_EXCHANGE, amqp_constants.EXCHANGE_DELETE)
@@ -275,6 +317,11 @@ class Channel:
                       no_wait=False, arguments=None):
         if arguments is None:
             arguments = {}
+        cache = self.protocol.topology_cache
+        if cache is not None:
+            yield from self._ensure_open()
+            if cache.has_binding('exchange', exchange_destination, exchange_source, routing_key, arguments):
+                return True
         frame = amqp_frame.AmqpRequest(self.protocol._stream_writer, amqp_constants.TYPE_METHOD, self.channel_id)
         frame.declare_method(
             amqp_constants.CLASS_EXCHANGE, amqp_constants.EXCHANGE_BIND)
@@ -287,8 +334,11 @@ class Channel:
 
         request.write_bits(no_wait)
         request.write_table(arguments)
-        return (yield from self._write_frame_awaiting_response(
-            'exchange_bind', frame, request, no_wait))
+        result = yield from self._write_frame_awaiting_response(
+            'exchange_bind', frame, request, no_wait)
+        if cache is not None and not no_wait:
+            cache.add_binding('exchange', exchange_destination, exchange_source, routing_key, arguments)
+        return result
 
     @asyncio.coroutine
     def exchange_bind_ok(self, frame):
@@ -301,6 +351,9 @@ class Channel:
                         no_wait=False, arguments=None):
         if arguments is None:
             arguments = {}
+        if self.protocol.topology_cache is not None:
+            self.protocol.topology_cache.remove_binding(
+                'exchange', exchange_destination, exchange_source, routing_key, arguments)
         frame = amqp_frame.AmqpRequest(self.protocol._stream_writer, amqp_constants.TYPE_METHOD, self.channel_id)
         frame.declare_method(
             amqp_constants.EXCHANGE_UNBIND, amqp_constants.EXCHANGE_UNBIND)
@@ -350,6 +403,14 @@ class Channel:
 
         if not queue_name:
             queue_name = ''
+        # server-named queues are always declared again
+        cache = None if passive or not queue_name else self.protocol.topology_cache
+        if cache is not None:
+            yield from self._ensure_open()
+            results = cache.get_queue(queue_name, durable, exclusive, auto_delete, arguments)
+            if results is not None:
+                return results
+
         frame = amqp_frame.AmqpRequest(self.protocol._stream_writer, amqp_constants.TYPE_METHOD, self.channel_id)
         frame.declare_method(
             amqp_constants.CLASS_QUEUE, amqp_constants.QUEUE_DECLARE)
@@ -358,8 +419,11 @@ class Channel:
         request.write_shortstr(queue_name)
         request.write_bits(passive, durable, exclusive, auto_delete, no_wait)
         request.write_table(arguments)
-        return (yield from self._write_frame_awaiting_response(
-            'queue_declare', frame, request, no_wait))
+        results = yield from self._write_frame_awaiting_response(
+            'queue_declare', frame, request, no_wait)
+        if cache is not None and not no_wait:
+            cache.add_queue(queue_name, durable, exclusive, auto_delete, arguments, results)
+        return results
 
     @asyncio.coroutine
     def queue_declare_ok(self, frame):
@@ -382,6 +446,8 @@ class Channel:
                if_empty:       bool, the queue is deleted if it has no messages. Raise if not.
                no_wait:        bool, if set, the server will not respond to the method
         """
+        if self.protocol.topology_cache is not None:
+            self.protocol.topology_cache.remove_queue(queue_name)
         frame = amqp_frame.AmqpRequest(self.protocol._stream_writer, amqp_constants.TYPE_METHOD, self.channel_id)
         frame.declare_method(
             amqp_constants.CLASS_QUEUE, amqp_constants.QUEUE_DELETE)
@@ -404,6 +470,11 @@ class Channel:
         """Bind a queue and a channel."""
         if arguments is None:
             arguments = {}
+        cache = self.protocol.topology_cache
+        if cache is not None:
+            yield from self._ensure_open()
+            if cache.has_binding('queue', queue_name, exchange_name, routing_key, arguments):
+                return True
         frame = amqp_frame.AmqpRequest(self.protocol._stream_writer, amqp_constants.TYPE_METHOD, self.channel_id)
         frame.declare_method(
             amqp_constants.CLASS_QUEUE, amqp_constants.QUEUE_BIND)
@@ -416,8 +487,11 @@ class Channel:
         request.write_shortstr(routing_key)
         request.write_octet(int(no_wait))
         request.write_table(arguments)
-        return (yield from self._write_frame_awaiting_response(
-            'queue_bind', frame, request, no_wait))
+        result = yield from self._write_frame_awaiting_response(
+            'queue_bind', frame, request, no_wait)
+        if cache is not None and not no_wait:
+            cache.add_binding('queue', queue_name, exchange_name, routing_key, arguments)
+        return result
 
     @asyncio.coroutine
     def queue_bind_ok(self, frame):
@@ -429,6 +503,8 @@ class Channel:
     def queue_unbind(self, queue_name, exchange_name, routing_key, arguments=None):
         if arguments is None:
             arguments = {}
+        if self.protocol.topology_cache is not None:
+            self.protocol.topology_cache.remove_binding('queue', queue_name, exchange_name, routing_key, arguments)
         frame = amqp_frame.AmqpRequest(self.protocol._stream_writer, amqp_constants.TYPE_METHOD, self.channel_id)
         frame.declare_method(
             amqp_constants.CLASS_QUEUE, amqp_constants.QUEUE_UNBIND)
@@ -477,6 +553,8 @@ class Channel:
     @asyncio.coroutine
     def basic_publish(self, payload, exchange_name, routing_key, properties=None, mandatory=False, immediate=False):
         assert payload, "Payload cannot be empty"
+        if not self.protocol.unblocked.is_set():
+            yield from self.protocol.wait_unblocked(self.protocol.blocked_timeout)
         payload_len = len(payload)
         method_frame = amqp_frame.AmqpRequest(
             self.protocol._stream_writer, amqp_constants.TYPE_METHOD, self.channel_id)
@@ -512,7 +590,7 @@ class Channel:
             encoder.payload.write(chunk)
             yield from self._write_frame(content_frame, encoder, drain=False)
 
-        yield from self.protocol._drain()
+        yield from self.protocol._drain(self.channel_id)
 
     @asyncio.coroutine
     def basic_qos(self, prefetch_size=0, prefetch_count=0, connection_global=None):
@@ -550,18 +628,34 @@ class Channel:
         logger.debug("Qos ok")
 
 
+    def _pop_confirm_waiters(self, delivery_tag, multiple):
+        """Returns the (delivery_tag, waiter) of the publishes confirmed by an ack or a nack"""
+        if not multiple:
+            return [(delivery_tag, self._get_waiter('basic_server_ack_{}'.format(delivery_tag)))]
+        waiters = []
+        for tag in range(self._confirm_floor, delivery_tag + 1):
+            fut = self._futures.pop('basic_server_ack_{}'.format(tag), None)
+            if fut is not None:
+                waiters.append((tag, fut))
+        self._confirm_floor = delivery_tag + 1
+        return waiters
+
     @asyncio.coroutine
     def basic_server_nack(self, frame, delivery_tag=None):
+        multiple = False
         if delivery_tag is None:
             decoder = amqp_frame.AmqpDecoder(frame.payload)
             delivery_tag = decoder.read_long_long()
-        fut = self._get_waiter('basic_server_ack_{}'.format(delivery_tag))
-        logger.debug('Received nack for delivery tag %r', delivery_tag)
-        fut.set_exception(exceptions.PublishFailed(delivery_tag))
+            multiple = bool(decoder.read_octet() & 1)
+        logger.debug('Received nack for delivery tag %r (multiple=%s)', delivery_tag, multiple)
+        for tag, fut in self._pop_confirm_waiters(delivery_tag, multiple):
+            if not fut.done():
+                fut.set_exception(exceptions.PublishFailed(tag))
 
     @asyncio.coroutine
     def basic_consume(self, callback, queue_name='', consumer_tag='', no_local=False, no_ack=False,
-                      exclusive=False, no_wait=False, arguments=None):
+                      exclusive=False, no_wait=False, arguments=None, body_allocator=None,
+                      ack_timeout=None):
         """Starts the consumption of message into a queue.
         the callback will be called each time we're receiving a message.
 
@@ -577,7 +671,17 @@ class Channel:
                                 meaning only this consumer can access the queue
                 no_wait:        bool, if set, the server will not respond to the method
                 arguments:      dict, AMQP arguments to be passed to the server
+                body_allocator: callable, called with `(body_size, envelope, properties)`
+                                it returns a `(buffer, body)` tuple: the content is
+                                written into the writable `buffer` and `body` is given
+                                to the callback. When it returns None, the body is
+                                assembled into bytes.
+                ack_timeout:    float, the messages not acknowledged, rejected nor
+                                nacked after `ack_timeout` seconds are requeued, and
+                                their late acknowledgement is dropped
         """
+        if ack_timeout is not None and no_ack:
+            raise ValueError("ack_timeout needs no_ack=False")
         # If a consumer tag was not passed, create one
         consumer_tag = consumer_tag or 'ctag%i.%s' % (self.channel_id, uuid.uuid4().hex)
 
@@ -596,6 +700,10 @@ class Channel:
         request.write_table(arguments)
 
         self.consumer_callbacks[consumer_tag] = callback
+        if body_allocator is not None:
+            self.consumer_body_allocators[consumer_tag] = body_allocator
+        if ack_timeout is not None:
+            self.consumer_ack_timeouts[consumer_tag] = ack_timeout
         self.last_consumer_tag = consumer_tag
 
         return_value = yield from self._write_frame_awaiting_response(
@@ -619,24 +727,45 @@ class Channel:
     @asyncio.coroutine
     def basic_deliver(self, frame):
         response = amqp_frame.AmqpDecoder(frame.payload)
-        consumer_tag = response.read_shortstr()
+        consumer_tag = response.read_interned_shortstr()
         delivery_tag = response.read_long_long()
         is_redeliver = response.read_bit()
-        exchange_name = response.read_shortstr()
-        routing_key = response.read_shortstr()
+        exchange_name = response.read_interned_shortstr()
+        routing_key = response.read_interned_shortstr()
         content_header_frame = yield from self.protocol.get_frame()
-
-        buffer = io.BytesIO()
-        while(buffer.tell() < content_header_frame.body_size):
-            content_body_frame = yield from self.protocol.get_frame()
-            buffer.write(content_body_frame.payload)
-
-        body = buffer.getvalue()
         envelope = Envelope(consumer_tag, delivery_tag, exchange_name, routing_key, is_redeliver)
         properties = content_header_frame.properties
 
+        allocator = self.consumer_body_allocators.get(consumer_tag)
+        allocated = None
+        if allocator is not None:
+            allocated = allocator(content_header_frame.body_size, envelope, properties)
+        if allocated is None:
+            buffer = io.BytesIO()
+            while(buffer.tell() < content_header_frame.body_size):
+                content_body_frame = yield from self.protocol.get_frame()
+                buffer.write(content_body_frame.payload)
+            body = buffer.getvalue()
+        else:
+            buffer, body = allocated
+            view = memoryview(buffer)
+            offset = 0
+            try:
+                while offset < content_header_frame.body_size:
+                    content_body_frame = yield from self.protocol.get_frame()
+                    chunk = content_body_frame.payload
+                    view[offset:offset + len(chunk)] = chunk
+                    offset += len(chunk)
+            finally:
+                view.release()
+
         callback = self.consumer_callbacks[consumer_tag]
 
+        ack_timeout = self.consumer_ack_timeouts.get(consumer_tag)
+        if ack_timeout is not None:
+            self._ack_deadlines[delivery_tag] = self.protocol._timer_wheel.call_later(
+                ack_timeout, self._ack_expired, delivery_tag)
+
         event = self._ctag_events.get(consumer_tag)
         if event:
             yield from event.wait()
@@ -674,7 +803,8 @@ class Channel:
         logger.debug("Cancel ok")
 
     @asyncio.coroutine
-    def basic_get(self, queue_name='', no_ack=False):
+    def _basic_get_request(self, waiter_id, queue_name, no_ack, drain=True):
+        '''Write a basic.get frame and return the future of its response'''
         frame = amqp_frame.AmqpRequest(
             self.protocol._stream_writer, amqp_constants.TYPE_METHOD, self.channel_id)
         frame.declare_method(
@@ -683,8 +813,63 @@ class Channel:
         request.write_short(0)
         request.write_shortstr(queue_name)
         request.write_bits(no_ack)
-        return (yield from self._write_frame_awaiting_response(
-            'basic_get', frame, request, no_wait=False))
+        fut = self._set_waiter(waiter_id)
+        self._basic_get_waiters.append(waiter_id)
+        try:
+            yield from self._write_frame(frame, request, drain=drain)
+        except Exception:
+            self._basic_get_waiters.remove(waiter_id)
+            self._get_waiter(waiter_id)
+            fut.cancel()
+            raise
+        return fut
+
+    @asyncio.coroutine
+    def basic_get(self, queue_name='', no_ack=False):
+        fut = yield from self._basic_get_request('basic_get', queue_name, no_ack)
+        return (yield from fut)
+
+    @asyncio.coroutine
+    def basic_get_many(self, queue_name='', max_messages=100, no_ack=False, window=50):
+        """Fetch up to `max_messages` messages by pipelining basic.get requests.
+
+            Args:
+                queue_name:     str, the queue to receive message from
+                max_messages:   int, the maximum number of messages to fetch
+                no_ack:         bool, if set the server does not expect
+                                acknowledgements for messages
+                window:         int, the maximum number of basic.get requests in flight
+
+            No new request is sent once the queue is found empty, but the messages
+            fetched by the requests still in flight are returned as well.
+
+            Returns:            a list of dicts as returned by `basic_get`, in queue order
+        """
+        if max_messages < 0:
+            raise ValueError("max_messages must be positive or zero, not %r" % max_messages)
+        if window < 1:
+            raise ValueError("window must be at least 1, not %r" % window)
+        pending = deque()
+        messages = []
+        sent = 0
+        empty = False
+        try:
+            while pending or (sent < max_messages and not empty):
+                while sent < max_messages and not empty and len(pending) < window:
+                    waiter_id = 'basic_get_{}'.format(next(self._basic_get_ids))
+                    pending.append((yield from self._basic_get_request(
+                        waiter_id, queue_name, no_ack, drain=False)))
+                    sent += 1
+                yield from self.protocol._drain(self.channel_id)
+                try:
+                    messages.append((yield from pending.popleft()))
+                except exceptions.EmptyQueue:
+                    empty = True
+        finally:
+            for fut in pending:
+                # don't let the outcome of the abandoned requests go unretrieved
+                fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return messages
 
     @asyncio.coroutine
     def basic_get_ok(self, frame):
@@ -692,8 +877,8 @@ class Channel:
         decoder = amqp_frame.AmqpDecoder(frame.payload)
         data['delivery_tag'] = decoder.read_long_long()
         data['redelivered'] = bool(decoder.read_octet())
-        data['exchange_name'] = decoder.read_shortstr()
-        data['routing_key'] = decoder.read_shortstr()
+        data['exchange_name'] = decoder.read_interned_shortstr()
+        data['routing_key'] = decoder.read_interned_shortstr()
         data['message_count'] = decoder.read_long()
         content_header_frame = yield from self.protocol.get_frame()
 
@@ -704,16 +889,53 @@ class Channel:
 
         data['message'] = buffer.getvalue()
         data['properties'] = content_header_frame.properties
-        future = self._get_waiter('basic_get')
+        future = self._get_waiter(self._basic_get_waiters.popleft())
         future.set_result(data)
 
     @asyncio.coroutine
     def basic_get_empty(self, frame):
-        future = self._get_waiter('basic_get')
+        future = self._get_waiter(self._basic_get_waiters.popleft())
         future.set_exception(exceptions.EmptyQueue)
 
+    def _ack_expired(self, delivery_tag):
+        del self._ack_deadlines[delivery_tag]
+        self._expired_deliveries.add(delivery_tag)
+        logger.warning("Delivery %d not acknowledged in time, requeued", delivery_tag)
+        ensure_future(self._requeue_expired(delivery_tag), loop=self._loop)
+
+    @asyncio.coroutine
+    def _requeue_expired(self, delivery_tag):
+        try:
+            yield from self._write_reject(delivery_tag, requeue=True)
+        except exceptions.AioamqpException:
+            logger.warning("Unable to requeue the delivery %d", delivery_tag, exc_info=True)
+
+    def _settle_delivery(self, delivery_tag, multiple):
+        """Cancel the ack deadlines of the settled deliveries
+
+        Returns False when the delivery was already requeued by its deadline.
+        """
+        if not self._ack_deadlines and not self._expired_deliveries:
+            return True
+        if multiple:
+            for tag in [tag for tag in self._ack_deadlines if tag <= delivery_tag]:
+                self._ack_deadlines.pop(tag).cancel()
+            # the server only settles the outstanding deliveries
+            self._expired_deliveries = {tag for tag in self._expired_deliveries if tag > delivery_tag}
+            return True
+        if delivery_tag in self._expired_deliveries:
+            self._expired_deliveries.discard(delivery_tag)
+            logger.warning("Delivery %d already requeued, its settlement is dropped", delivery_tag)
+            return False
+        handle = self._ack_deadlines.pop(delivery_tag, None)
+        if handle is not None:
+            handle.cancel()
+        return True
+
     @asyncio.coroutine
     def basic_client_ack(self, delivery_tag, multiple=False):
+        if not self._settle_delivery(delivery_tag, multiple):
+            return
         frame = amqp_frame.AmqpRequest(
             self.protocol._stream_writer, amqp_constants.TYPE_METHOD, self.channel_id)
         frame.declare_method(
@@ -725,6 +947,8 @@ class Channel:
 
     @asyncio.coroutine
     def basic_client_nack(self, delivery_tag, multiple=False, requeue=True):
+        if not self._settle_delivery(delivery_tag, multiple):
+            return
         frame = amqp_frame.AmqpRequest(
             self.protocol._stream_writer, amqp_constants.TYPE_METHOD, self.channel_id)
         frame.declare_method(
@@ -739,12 +963,20 @@ class Channel:
     def basic_server_ack(self, frame):
         decoder = amqp_frame.AmqpDecoder(frame.payload)
         delivery_tag = decoder.read_long_long()
-        fut = self._get_waiter('basic_server_ack_{}'.format(delivery_tag))
-        logger.debug('Received ack for delivery tag %s', delivery_tag)
-        fut.set_result(True)
+        multiple = bool(decoder.read_octet() & 1)
+        logger.debug('Received ack for delivery tag %s (multiple=%s)', delivery_tag, multiple)
+        for _tag, fut in self._pop_confirm_waiters(delivery_tag, multiple):
+            if not fut.done():
+                fut.set_result(True)
 
     @asyncio.coroutine
     def basic_reject(self, delivery_tag, requeue=False):
+        if not self._settle_delivery(delivery_tag, False):
+            return
+        yield from self._write_reject(delivery_tag, requeue)
+
+    @asyncio.coroutine
+    def _write_reject(self, delivery_tag, requeue):
         frame = amqp_frame.AmqpRequest(
             self.protocol._stream_writer, amqp_constants.TYPE_METHOD, self.channel_id)
         frame.declare_method(
@@ -789,8 +1021,19 @@ class Channel:
     exchange = exchange_declare
 
     @asyncio.coroutine
-    def publish(self, payload, exchange_name, routing_key, properties=None, mandatory=False, immediate=False):
+    def publish(self, payload, exchange_name, routing_key, properties=None, mandatory=False, immediate=False,
+                confirm_timeout=None):
+        """Publish a message
+
+            With publisher confirms, wait for the broker to confirm the message, and
+            raise asyncio.TimeoutError if it didn't after `confirm_timeout` seconds.
+
+            While the broker blocks the connection, wait for it to be unblocked, see
+            the `blocked_timeout` of the connection.
+        """
         assert payload, "Payload cannot be empty"
+        if not self.protocol.unblocked.is_set():
+            yield from self.protocol.wait_unblocked(self.protocol.blocked_timeout)
 
         if self.publisher_confirms:
             delivery_tag = next(self.delivery_tag_iter)
@@ -828,10 +1071,18 @@ class Channel:
             encoder.payload.write(chunk)
             yield from self._write_frame(content_frame, encoder, drain=False)
 
-        yield from self.protocol._drain()
+        yield from self.protocol._drain(self.channel_id)
 
         if self.publisher_confirms:
-            yield from fut
+            if confirm_timeout is None:
+                yield from fut
+                return
+            # the waiter stays in place for the ack or nack to come
+            timer = self.protocol._timer_wheel.call_later(confirm_timeout, _expire_future, fut)
+            try:
+                yield from fut
+            finally:
+                timer.cancel()
 
     @asyncio.coroutine
     def confirm_select(self, *, no_wait=False):
@@ -850,6 +1101,7 @@ class Channel:
     def confirm_select_ok(self, frame):
         self.publisher_confirms = True
         self.delivery_tag_iter = count(1)
+        self._confirm_floor = 1
         fut = self._get_waiter('confirm_select')
         fut.set_result(True)
         logger.debug("Confirm selected")
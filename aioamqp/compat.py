@@ -8,4 +8,8 @@ import asyncio
 try:
     from asyncio import ensure_future
 except ImportError:
-    ensure_future = asyncio.async
+    # asyncio.async is a syntax error since python 3.7
+    ensure_future = getattr(asyncio, 'async')
+
+# python < 3.7: the transports call data_received() instead of get_buffer() and buffer_updated()
+BufferedProtocol = getattr(asyncio, 'BufferedProtocol', asyncio.BaseProtocol)
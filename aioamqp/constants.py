@@ -35,6 +35,8 @@ CONNECTION_OPEN = 40
 CONNECTION_OPEN_OK = 41
 CONNECTION_CLOSE = 50
 CONNECTION_CLOSE_OK = 51
+CONNECTION_BLOCKED = 60
+CONNECTION_UNBLOCKED = 61
 
 CHANNEL_OPEN = 10
 CHANNEL_OPEN_OK = 11
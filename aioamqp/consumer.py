@@ -0,0 +1,150 @@
+"""
+    Consumers running their handler out of the event loop
+"""
+
+import asyncio
+import logging
+
+from . import exceptions
+from .compat import ensure_future
+from .shm import SharedBody
+
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedDispatcher:
+    """Handle the messages of a consumer in tasks, at most `limit` at the same time
+
+    `limit` is also the prefetch count of the channel, see `set_qos()`: the broker
+    doesn't send more messages than can be handled, `dispatch()` doesn't block.
+    """
+
+    def __init__(self, channel, limit):
+        """
+            Args:
+                channel:    Channel, the channel consumed from
+                limit:      int, the maximum number of messages handled at the same time
+        """
+        self._loop = channel._loop
+        self.channel = channel
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit, loop=self._loop)
+        self._tasks = set()
+
+    def __len__(self):
+        """The number of messages being handled"""
+        return len(self._tasks)
+
+    @asyncio.coroutine
+    def set_qos(self):
+        yield from self.channel.basic_qos(prefetch_count=self.limit)
+
+    @asyncio.coroutine
+    def dispatch(self, coro):
+        """Run the coroutine handling a message in a task"""
+        try:
+            # the prefetch count keeps the broker from sending more, this should not block
+            yield from self._semaphore.acquire()
+        except BaseException:
+            coro.close()
+            raise
+        task = ensure_future(self._run(coro), loop=self._loop)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    @asyncio.coroutine
+    def _run(self, coro):
+        try:
+            yield from coro
+        finally:
+            self._semaphore.release()
+
+    @asyncio.coroutine
+    def wait(self):
+        """Wait for the messages being handled"""
+        if self._tasks:
+            yield from asyncio.wait(self._tasks, loop=self._loop)
+
+
+class ExecutorConsumer:
+    """Run a blocking or CPU-bound handler in an executor
+
+    The handler is a plain function called with `(body, envelope, properties)` in
+    `executor` (a ThreadPoolExecutor or a ProcessPoolExecutor, in which case the
+    handler must be picklable), so it doesn't block the reading of the frames and
+    the heartbeats. The message is acknowledged on the loop when the handler
+    returns, and rejected when it raises.
+
+    At most `prefetch_count` messages are handled at the same time: this is the
+    prefetch count of the channel, and the broker doesn't send more.
+
+    With a SharedMemoryPool, the large bodies are assembled in shared memory and
+    the handler receives a SharedBody instead of bytes: only its descriptor goes
+    through the pipe of a process pool.
+    """
+
+    def __init__(self, channel, handler, executor=None, prefetch_count=10, requeue_on_error=False,
+                 shared_memory=None):
+        """
+            Args:
+                channel:            Channel, the channel to consume from
+                handler:            function, called with `(body, envelope, properties)`
+                executor:           concurrent.futures.Executor, defaults to the loop's executor
+                prefetch_count:     int, the maximum number of messages being handled
+                requeue_on_error:   bool, requeue the messages whose handler raised
+                shared_memory:      SharedMemoryPool, the pool to assemble the large bodies in
+        """
+        self._loop = channel._loop
+        self.channel = channel
+        self.handler = handler
+        self.executor = executor
+        self.prefetch_count = prefetch_count
+        self.requeue_on_error = requeue_on_error
+        self.shared_memory = shared_memory
+        self.consumer_tag = None
+        self._dispatcher = BoundedDispatcher(channel, prefetch_count)
+
+    @property
+    def in_flight(self):
+        """The number of messages being handled"""
+        return len(self._dispatcher)
+
+    @asyncio.coroutine
+    def start(self, queue_name, **kwargs):
+        """Start consuming `queue_name`, the kwargs are given to `Channel.basic_consume()`"""
+        yield from self._dispatcher.set_qos()
+        if self.shared_memory is not None:
+            kwargs['body_allocator'] = self.shared_memory.body_allocator
+        result = yield from self.channel.basic_consume(self._on_message, queue_name=queue_name, **kwargs)
+        self.consumer_tag = result['consumer_tag']
+
+    @asyncio.coroutine
+    def stop(self):
+        """Stop consuming, and wait for the messages being handled"""
+        if self.consumer_tag is not None and self.channel.is_open:
+            yield from self.channel.basic_cancel(self.consumer_tag)
+        self.consumer_tag = None
+        yield from self._dispatcher.wait()
+
+    @asyncio.coroutine
+    def _on_message(self, channel, body, envelope, properties):
+        yield from self._dispatcher.dispatch(self._handle(body, envelope, properties))
+
+    @asyncio.coroutine
+    def _handle(self, body, envelope, properties):
+        try:
+            try:
+                yield from self._loop.run_in_executor(self.executor, self.handler, body, envelope, properties)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Error while handling the message %r", envelope.delivery_tag)
+                yield from self.channel.basic_reject(envelope.delivery_tag, requeue=self.requeue_on_error)
+            else:
+                yield from self.channel.basic_client_ack(envelope.delivery_tag)
+        except exceptions.AioamqpException:
+            # the message is redelivered when the channel is closed
+            logger.warning("Unable to settle the message %r", envelope.delivery_tag, exc_info=True)
+        finally:
+            if isinstance(body, SharedBody):
+                # settled: the segment can be reused
+                self.shared_memory.release(body)
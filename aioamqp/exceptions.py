@@ -23,6 +23,10 @@ class NoChannelAvailable(AioamqpException):
     """There is no room left for more channels"""
 
 
+class ConnectionBlocked(AioamqpException):
+    """The broker blocked the connection, it doesn't read the publishes"""
+
+
 class ChannelClosed(AioamqpException):
     def __init__(self, code=0, message='Channel is closed'):
         super().__init__(code, message)
@@ -49,3 +53,7 @@ class PublishFailed(AioamqpException):
     def __repr__(self):
         return 'Publish failed because a nack was received for delivery_tag {}'.format(
             self.delivery_tag)
+
+
+class RpcError(AioamqpException):
+    """The remote procedure failed"""
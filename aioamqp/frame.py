@@ -39,20 +39,178 @@ Content Payload
 """
 
 import asyncio
+import calendar
+import datetime
 import io
 import struct
 import socket
 import os
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
 from itertools import count
 from decimal import Decimal
 
 from . import exceptions
 from . import constants as amqp_constants
 from .properties import Properties
+from .scheduler import is_content
 
 
 DUMP_FRAMES = False
 
+# the number of distinct short strings kept decoded
+SHORTSTR_CACHE_SIZE = 1024
+
+_MESSAGE_PROPERTIES = frozenset(amqp_constants.MESSAGE_PROPERTIES)
+
+
+_SIGNED_OCTET = struct.Struct('!b')
+_LONG = struct.Struct('!I')
+_SIGNED_LONG = struct.Struct('!i')
+_SIGNED_LONG_LONG = struct.Struct('!q')
+_DOUBLE = struct.Struct('!d')
+_DECIMAL = struct.Struct('!Bi')
+
+
+def _pack_table(table):
+    """Returns the encoded fields of `table` (a Mapping), without the table length"""
+    if isinstance(table, LazyTable):
+        # received headers published again, still encoded
+        return table._data  # pylint: disable=protected-access
+    buffer = bytearray()
+    for key, value in table.items():
+        if isinstance(key, str):
+            key = key.encode()
+        if len(key) > 255:
+            raise ValueError("table key {!r} is longer than 255 bytes".format(key))
+        buffer.append(len(key))
+        buffer += key
+        _pack_value(buffer, value)
+    return buffer
+
+
+def _pack_value(buffer, value):
+    """Appends the type and the encoded `value` to `buffer`"""
+    value_type = type(value)
+    try:
+        packer = _VALUE_PACKERS[value_type]
+    except KeyError:
+        # a subclass of a supported type
+        for base, packer in _VALUE_PACKERS_BY_BASE:
+            if isinstance(value, base):
+                _VALUE_PACKERS[value_type] = packer
+                break
+        else:
+            raise TypeError("type({}) unsupported".format(value_type))
+    packer(buffer, value)
+
+
+def _pack_longstr(buffer, value, value_type=b'S'):
+    if isinstance(value, str):
+        value = value.encode()
+    buffer += value_type
+    buffer += _LONG.pack(len(value))
+    buffer += value
+
+
+def _pack_byte_array(buffer, value):
+    _pack_longstr(buffer, value, b'x')
+
+
+def _pack_bool(buffer, value):
+    buffer += b't\x01' if value else b't\x00'
+
+
+def _pack_int(buffer, value):
+    # the smallest signed type: RabbitMQ doesn't know the unsigned ones
+    if -0x80 <= value < 0x80:
+        buffer += b'b'
+        buffer += _SIGNED_OCTET.pack(value)
+    elif -0x80000000 <= value < 0x80000000:
+        buffer += b'I'
+        buffer += _SIGNED_LONG.pack(value)
+    elif -0x8000000000000000 <= value < 0x8000000000000000:
+        buffer += b'l'
+        buffer += _SIGNED_LONG_LONG.pack(value)
+    else:
+        raise ValueError("{} doesn't fit in a signed 64 bits integer".format(value))
+
+
+def _pack_float(buffer, value):
+    buffer += b'd'
+    buffer += _DOUBLE.pack(value)
+
+
+def _pack_decimal(buffer, value):
+    if not value.is_finite():
+        raise ValueError("{} doesn't fit in an AMQP decimal".format(value))
+    _sign, _digits, exponent = value.as_tuple()
+    decimals = max(-exponent, 0)
+    unscaled = int(value.scaleb(decimals))
+    if decimals > 255 or not -0x80000000 <= unscaled < 0x80000000:
+        raise ValueError("{} doesn't fit in an AMQP decimal".format(value))
+    buffer += b'D'
+    buffer += _DECIMAL.pack(decimals, unscaled)
+
+
+def _pack_timestamp(buffer, value):
+    # the naive datetimes are UTC
+    buffer += b'T'
+    buffer += _SIGNED_LONG_LONG.pack(calendar.timegm(value.utctimetuple()))
+
+
+def _pack_array(buffer, value):
+    array = bytearray()
+    for item in value:
+        _pack_value(array, item)
+    buffer += b'A'
+    buffer += _LONG.pack(len(array))
+    buffer += array
+
+
+def _pack_nested_table(buffer, value):
+    table = _pack_table(value)
+    buffer += b'F'
+    buffer += _LONG.pack(len(table))
+    buffer += table
+
+
+def _pack_void(buffer, _value):
+    buffer += b'V'
+
+
+# python type -> function appending its AMQP field value to a bytearray
+_VALUE_PACKERS = {
+    str: _pack_longstr,
+    bytes: _pack_longstr,
+    bytearray: _pack_byte_array,
+    bool: _pack_bool,
+    int: _pack_int,
+    float: _pack_float,
+    Decimal: _pack_decimal,
+    datetime.datetime: _pack_timestamp,
+    dict: _pack_nested_table,
+    list: _pack_array,
+    tuple: _pack_array,
+    type(None): _pack_void,
+}
+
+# the packers of the subclasses, bool before int
+_VALUE_PACKERS_BY_BASE = (
+    (str, _pack_longstr),
+    (bytes, _pack_longstr),
+    (bytearray, _pack_byte_array),
+    (bool, _pack_bool),
+    (int, _pack_int),
+    (float, _pack_float),
+    (Decimal, _pack_decimal),
+    (datetime.datetime, _pack_timestamp),
+    (Mapping, _pack_nested_table),
+    (list, _pack_array),
+    (tuple, _pack_array),
+)
+
 
 class AmqpEncoder:
 
@@ -60,33 +218,16 @@ class AmqpEncoder:
         self.payload = io.BytesIO()
 
     def write_table(self, data_dict):
-
-        self.write_long(0)                  # the table length (set later)
-        if data_dict:
-            start = self.payload.tell()
-            for key, value in data_dict.items():
-                self.write_shortstr(key)
-                self.write_value(value)
-            table_length = self.payload.tell() - start
-            self.payload.seek(start - 4)    # move before the long
-            self.write_long(table_length)   # and set the table length
-            self.payload.seek(0, os.SEEK_END)  # return at the end
+        """Write an AMQP table, `data_dict` is a Mapping (or None for an empty table)"""
+        table = _pack_table(data_dict) if data_dict else b''
+        self.write_long(len(table))
+        self.payload.write(table)
 
     def write_value(self, value):
-        if isinstance(value, (bytes, str)):
-            self.payload.write(b'S')
-            self.write_longstr(value)
-        elif isinstance(value, bool):
-            self.payload.write(b't')
-            self.write_bool(value)
-        elif isinstance(value, dict):
-            self.payload.write(b'F')
-            self.write_table(value)
-        elif isinstance(value, int):
-            self.payload.write(b'I')
-            self.write_long(value)
-        else:
-            raise Exception("type({}) unsupported".format(type(value)))
+        """Write the type and the value of a table field"""
+        buffer = bytearray()
+        _pack_value(buffer, value)
+        self.payload.write(buffer)
 
     def write_bits(self, *args):
         """Write consecutive bools to one byte"""
@@ -121,10 +262,14 @@ class AmqpEncoder:
             self.payload.write(string)
 
     def write_longstr(self, string):
+        if isinstance(string, str):
+            string = string.encode()
         self.write_long(len(string))
         self._write_string(string)
 
     def write_shortstr(self, string):
+        if isinstance(string, str):
+            string = string.encode()
         self.write_octet(len(string))
         self._write_string(string)
 
@@ -135,8 +280,12 @@ class AmqpEncoder:
             self.write_short(0)
             return
 
-        diff = set(properties.keys()) - set(amqp_constants.MESSAGE_PROPERTIES)
-        if diff:
+        if isinstance(properties, EncodedProperties):
+            self.payload.write(properties.encoded)
+            return
+
+        if not properties.keys() <= _MESSAGE_PROPERTIES:
+            diff = set(properties.keys()) - _MESSAGE_PROPERTIES
             raise ValueError("%s are not properties, valid properties are %s" % (
                 diff, amqp_constants.MESSAGE_PROPERTIES))
 
@@ -205,6 +354,47 @@ class AmqpEncoder:
         self.payload.seek(0, os.SEEK_END)
 
 
+class ShortstrCache:
+    """Bounded LRU cache of the decoded short strings
+
+    The consumer tags, exchanges, routing keys and headers keys of the received
+    messages take a handful of values: a cached one isn't decoded again, and all
+    the messages share the same str object. It is shared by the connections and
+    by the threads decoding the headers of a LazyTable, it is guarded by a lock.
+    """
+
+    def __init__(self, maxsize=SHORTSTR_CACHE_SIZE):
+        """
+            Args:
+                maxsize:    int, the number of strings kept, the least recently used are dropped
+        """
+        self.maxsize = maxsize
+        # encoded bytes -> str, the least recently used first
+        self._strings = OrderedDict()
+        self._lock = threading.Lock()
+
+    def decode(self, data):
+        """Returns the str of the utf-8 encoded `data` (bytes)"""
+        with self._lock:
+            try:
+                string = self._strings[data]
+            except KeyError:
+                string = data.decode()
+                self._strings[data] = string
+                if len(self._strings) > self.maxsize:
+                    self._strings.popitem(last=False)
+            else:
+                self._strings.move_to_end(data)
+            return string
+
+    def clear(self):
+        with self._lock:
+            self._strings.clear()
+
+
+shortstr_cache = ShortstrCache()
+
+
 class AmqpDecoder:
     def __init__(self, reader):
         self.reader = reader
@@ -264,11 +454,26 @@ class AmqpDecoder:
         data = self.reader.read(string_len)
         return data.decode()
 
+    def read_interned_shortstr(self):
+        """Reads a short string taking a handful of values, through the shortstr_cache
+
+        The consumer tags, exchanges, routing keys and table keys, not the
+        per-message values such as the correlation ids.
+        """
+        data = self.reader.read(1)
+        string_len = struct.unpack('!B', data)[0]
+        data = self.reader.read(string_len)
+        return shortstr_cache.decode(data)
+
     def read_longstr(self):
         string_len = self.read_long()
         data = self.reader.read(string_len)
         return data.decode()
 
+    def read_byte_array(self):
+        string_len = self.read_long()
+        return bytearray(self.reader.read(string_len))
+
     def read_timestamp(self):
         # TODO: decode into datetime?
         return self.read_long_long()
@@ -279,31 +484,43 @@ class AmqpDecoder:
         table_data = AmqpDecoder(io.BytesIO(self.reader.read(table_len)))
         table = {}
         while table_data.reader.tell() < table_len:
-            var_name = table_data.read_shortstr()
+            var_name = table_data.read_interned_shortstr()
             var_value = self.read_table_subitem(table_data)
             table[var_name] = var_value
         return table
 
+    def read_lazy_table(self):
+        """Reads an AMQP table as a LazyTable"""
+        table_len = self.read_long()
+        return LazyTable(self.reader.read(table_len))
+
     _table_subitem_reader_map = {
         't': 'read_bit',
-        'b': 'read_octet',
-        'B': 'read_signed_octet',
+        'b': 'read_signed_octet',
+        'B': 'read_octet',
         'U': 'read_signed_short',
         'u': 'read_short',
         'I': 'read_signed_long',
         'i': 'read_long',
-        'L': 'read_unsigned_long_long',
-        'l': 'read_long_long',
+        'L': 'read_long_long',
+        'l': 'read_signed_long_long',
         'f': 'read_float',
-        'd': 'read_float',
+        'd': 'read_double',
         'D': 'read_decimal',
         's': 'read_shortstr',
         'S': 'read_longstr',
+        'x': 'read_byte_array',
         'A': 'read_field_array',
         'T': 'read_timestamp',
         'F': 'read_table',
     }
 
+    # size of the fixed size values, by type
+    _table_subitem_sizes = {
+        't': 1, 'b': 1, 'B': 1, 'U': 2, 'u': 2, 'I': 4, 'i': 4, 'L': 8, 'l': 8,
+        'f': 4, 'd': 8, 'D': 5, 'T': 8, 'V': 0,
+    }
+
     def read_table_subitem(self, table_data):
         """Read `table_data` bytes, guess the type of the value, and cast it.
 
@@ -328,6 +545,203 @@ class AmqpDecoder:
         return field_array
 
 
+def _table_subitem_size(data, position):
+    """Returns the size of the table value at `position`, its type included"""
+    value_type = chr(data[position])
+    size = AmqpDecoder._table_subitem_sizes.get(value_type)  # pylint: disable=protected-access
+    if size is not None:
+        return 1 + size
+    if value_type == 's':
+        return 2 + data[position + 1]
+    if value_type in ('S', 'x', 'A', 'F'):
+        return 5 + struct.unpack_from('!I', data, position + 1)[0]
+    raise ValueError('Unknown value_type {}'.format(value_type))
+
+
+class LazyTable(Mapping):
+    """Read-only mapping of an AMQP table, decoding a value when it is looked up
+
+    The first lookup indexes the positions of the values, without decoding them.
+    The nested tables are LazyTables too. `to_dict()` decodes the whole table, and
+    a pickle of it is a dict.
+    """
+
+    def __init__(self, data):
+        """
+            Args:
+                data:   bytes or memoryview, the table without its length
+        """
+        self._data = memoryview(data)
+        # key -> position of the value
+        self._positions = None
+        self._values = {}
+
+    def _index(self):
+        data = self._data
+        positions = {}
+        position = 0
+        while position < len(data):
+            key_end = position + 1 + data[position]
+            key = shortstr_cache.decode(data[position + 1:key_end].tobytes())
+            positions[key] = key_end
+            position = key_end + _table_subitem_size(data, key_end)
+        self._positions = positions
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        if self._positions is None:
+            self._index()
+        position = self._positions[key]
+        value_data = self._data[position:position + _table_subitem_size(self._data, position)]
+        if value_data[0] == ord('F'):
+            value = LazyTable(value_data[5:])
+        else:
+            decoder = AmqpDecoder(io.BytesIO(value_data))
+            value = decoder.read_table_subitem(decoder)
+        self._values[key] = value
+        return value
+
+    def __iter__(self):
+        if self._positions is None:
+            self._index()
+        return iter(self._positions)
+
+    def __len__(self):
+        if self._positions is None:
+            self._index()
+        return len(self._positions)
+
+    def to_dict(self):
+        """Returns the table decoded as a dict, the nested tables included"""
+        return {
+            key: value.to_dict() if isinstance(value, LazyTable) else value
+            for key, value in self.items()
+        }
+
+    def __reduce__(self):
+        return (dict, (self.to_dict(),))
+
+    def __repr__(self):
+        return 'LazyTable(%r)' % self.to_dict()
+
+
+# name, flag and decoding method of the basic properties, in their order on the wire
+_PROPERTIES_DECODING = (
+    ('content_type', amqp_constants.FLAG_CONTENT_TYPE, 'read_shortstr'),
+    ('content_encoding', amqp_constants.FLAG_CONTENT_ENCODING, 'read_shortstr'),
+    ('headers', amqp_constants.FLAG_HEADERS, 'read_lazy_table'),
+    ('delivery_mode', amqp_constants.FLAG_DELIVERY_MODE, 'read_octet'),
+    ('priority', amqp_constants.FLAG_PRIORITY, 'read_octet'),
+    ('correlation_id', amqp_constants.FLAG_CORRELATION_ID, 'read_shortstr'),
+    ('reply_to', amqp_constants.FLAG_REPLY_TO, 'read_shortstr'),
+    ('expiration', amqp_constants.FLAG_EXPIRATION, 'read_shortstr'),
+    ('message_id', amqp_constants.FLAG_MESSAGE_ID, 'read_shortstr'),
+    ('timestamp', amqp_constants.FLAG_TIMESTAMP, 'read_long_long'),
+    ('type', amqp_constants.FLAG_TYPE, 'read_shortstr'),
+    ('user_id', amqp_constants.FLAG_USER_ID, 'read_shortstr'),
+    ('app_id', amqp_constants.FLAG_APP_ID, 'read_shortstr'),
+    ('cluster_id', amqp_constants.FLAG_CLUSTER_ID, 'read_shortstr'),
+)
+_PROPERTIES_DECODERS = {name: decode for name, _flag, decode in _PROPERTIES_DECODING}
+
+
+class EncodedProperties(Properties):
+    """Immutable message properties, encoded once
+
+    Publishing them writes the encoded properties as they are, instead of
+    encoding the properties dict of each publish. The headers are encoded when
+    the EncodedProperties are created, they must not be modified afterwards.
+    """
+    __slots__ = ('encoded',)
+
+    def __init__(self, properties=None, **kwargs):
+        """
+            Args:
+                properties:     dict, the properties, as given to `Channel.publish()`
+                kwargs:         the properties, as keyword arguments
+        """
+        properties = dict(properties or {}, **kwargs)
+        encoder = AmqpEncoder()
+        encoder.write_message_properties(properties)
+        super().__init__(**properties)
+        # set last: the properties are read-only from now on
+        self.encoded = encoder.payload.getvalue()
+
+    def __setattr__(self, name, value):
+        if hasattr(self, 'encoded'):
+            raise AttributeError("EncodedProperties are read-only")
+        super().__setattr__(name, value)
+
+    def to_dict(self):
+        """Returns the properties which are set, as a dict"""
+        return {
+            name: getattr(self, name) for name in amqp_constants.MESSAGE_PROPERTIES
+            if getattr(self, name) is not None
+        }
+
+    def __reduce__(self):
+        return (EncodedProperties, (self.to_dict(),))
+
+
+class LazyProperties(Properties):
+    """Properties of a received message, decoded on first access
+
+    It keeps the raw property list of the content header: a property, the headers
+    table in particular, is only decoded when its attribute is read. A copy or a
+    pickle of it is a plain Properties.
+    """
+    __slots__ = ('_raw', '_property_flags', '_decoder', '_offsets')
+
+    def __init__(self, raw, property_flags):  # pylint: disable=super-init-not-called
+        """
+            Args:
+                raw:                memoryview, the property list following the property flags
+                property_flags:     int, the property flags of the content header
+        """
+        self._raw = raw
+        self._property_flags = property_flags
+        self._decoder = None
+        # name -> position in raw of the properties present
+        self._offsets = None
+
+    def _scan(self):
+        self._decoder = AmqpDecoder(io.BytesIO(self._raw))
+        reader = self._decoder.reader
+        self._offsets = {}
+        for name, flag, decode in _PROPERTIES_DECODING:
+            if not self._property_flags & flag:
+                continue
+            self._offsets[name] = reader.tell()
+            if decode == 'read_shortstr':
+                reader.seek(self._decoder.read_octet(), io.SEEK_CUR)
+            elif decode == 'read_lazy_table':
+                reader.seek(self._decoder.read_long(), io.SEEK_CUR)
+            elif decode == 'read_octet':
+                reader.seek(1, io.SEEK_CUR)
+            else:
+                reader.seek(8, io.SEEK_CUR)
+
+    def __getattr__(self, name):
+        decode = _PROPERTIES_DECODERS.get(name)
+        if decode is None:
+            raise AttributeError(name)
+        if self._offsets is None:
+            self._scan()
+        value = None
+        offset = self._offsets.get(name)
+        if offset is not None:
+            self._decoder.reader.seek(offset)
+            value = getattr(self._decoder, decode)()
+        setattr(self, name, value)
+        return value
+
+    def __reduce__(self):
+        return (Properties, tuple(getattr(self, name) for name in amqp_constants.MESSAGE_PROPERTIES))
+
+
 class AmqpRequest:
     def __init__(self, writer, frame_type, channel):
         self.writer = writer
@@ -372,7 +786,8 @@ class AmqpRequest:
             transmission.write(content_header)
         transmission.write(payload.getvalue())
         transmission.write(amqp_constants.FRAME_END)
-        return self.writer.write(transmission.getvalue())
+        content = is_content(self.frame_type, self.class_id, self.method_id)
+        return self.writer.write_frame(self.channel, transmission.getvalue(), content)
 
 
 class AmqpResponse:
@@ -408,16 +823,11 @@ class AmqpResponse:
             raise exceptions.AmqpClosedConnection()
 
         try:
-            data = yield from self.reader.readexactly(7)
+            self.frame_type, self.channel, payload_data = yield from self.reader.read_frame()
         except (asyncio.IncompleteReadError, socket.error) as ex:
             raise exceptions.AmqpClosedConnection() from ex
-
-        frame_header = io.BytesIO(data)
-        self.header_decoder = AmqpDecoder(frame_header)
-        self.frame_type = self.header_decoder.read_octet()
-        self.channel = self.header_decoder.read_short()
-        self.frame_length = self.header_decoder.read_long()
-        payload_data = yield from self.reader.readexactly(self.frame_length)
+        self.frame_length = len(payload_data)
+        self.frame_end = amqp_constants.FRAME_END
 
         if self.frame_type == amqp_constants.TYPE_METHOD:
             self.payload = io.BytesIO(payload_data)
@@ -437,36 +847,9 @@ class AmqpResponse:
                 self.property_flags |= partial_flags << (flagword_index * 16)
                 if partial_flags & 1 == 0:
                     break
-            decoded_properties = {}
-            if self.property_flags & amqp_constants.FLAG_CONTENT_TYPE:
-                decoded_properties['content_type'] = self.payload_decoder.read_shortstr()
-            if self.property_flags & amqp_constants.FLAG_CONTENT_ENCODING:
-                decoded_properties['content_encoding'] = self.payload_decoder.read_shortstr()
-            if self.property_flags & amqp_constants.FLAG_HEADERS:
-                decoded_properties['headers'] = self.payload_decoder.read_table()
-            if self.property_flags & amqp_constants.FLAG_DELIVERY_MODE:
-                decoded_properties['delivery_mode'] = self.payload_decoder.read_octet()
-            if self.property_flags & amqp_constants.FLAG_PRIORITY:
-                decoded_properties['priority'] = self.payload_decoder.read_octet()
-            if self.property_flags & amqp_constants.FLAG_CORRELATION_ID:
-                decoded_properties['correlation_id'] = self.payload_decoder.read_shortstr()
-            if self.property_flags & amqp_constants.FLAG_REPLY_TO:
-                decoded_properties['reply_to'] = self.payload_decoder.read_shortstr()
-            if self.property_flags & amqp_constants.FLAG_EXPIRATION:
-                decoded_properties['expiration'] = self.payload_decoder.read_shortstr()
-            if self.property_flags & amqp_constants.FLAG_MESSAGE_ID:
-                decoded_properties['message_id'] = self.payload_decoder.read_shortstr()
-            if self.property_flags & amqp_constants.FLAG_TIMESTAMP:
-                decoded_properties['timestamp'] = self.payload_decoder.read_long_long()
-            if self.property_flags & amqp_constants.FLAG_TYPE:
-                decoded_properties['type'] = self.payload_decoder.read_shortstr()
-            if self.property_flags & amqp_constants.FLAG_USER_ID:
-                decoded_properties['user_id'] = self.payload_decoder.read_shortstr()
-            if self.property_flags & amqp_constants.FLAG_APP_ID:
-                decoded_properties['app_id'] = self.payload_decoder.read_shortstr()
-            if self.property_flags & amqp_constants.FLAG_CLUSTER_ID:
-                decoded_properties['cluster_id'] = self.payload_decoder.read_shortstr()
-            self.properties = Properties(**decoded_properties)
+            # decoded when the consumer reads them
+            self.properties = LazyProperties(
+                memoryview(payload_data)[self.payload.tell():], self.property_flags)
 
         elif self.frame_type == amqp_constants.TYPE_BODY:
             self.payload = payload_data
@@ -476,8 +859,6 @@ class AmqpResponse:
 
         else:
             raise ValueError("Message type {:x} not known".format(self.frame_type))
-        self.frame_end = yield from self.reader.readexactly(1)
-        assert self.frame_end == amqp_constants.FRAME_END
 
     def __str__(self):
         frame_data = {
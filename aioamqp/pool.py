@@ -0,0 +1,311 @@
+"""
+    Pools of pre-opened channels
+"""
+
+import asyncio
+import logging
+
+from . import exceptions
+from .compat import ensure_future
+
+
+logger = logging.getLogger(__name__)
+
+
+class ChannelPool:
+    """A fixed number of channels opened on a connection
+
+    Channels can be leased to a single user with `acquire()` and `release()`,
+    or shared by the publishers with `publish()`, which picks the channel with
+    the fewest publishes in flight. A channel closed by the broker is replaced
+    the next time its slot is used.
+    """
+
+    def __init__(self, protocol, size=10, publisher_confirms=False):
+        """
+            Args:
+                protocol:           AmqpProtocol, the connection to open the channels on
+                size:               int, the number of channels
+                publisher_confirms: bool, put the channels in confirm mode
+        """
+        self._loop = protocol._loop
+        self.protocol = protocol
+        self.size = size
+        self.publisher_confirms = publisher_confirms
+        self._channels = []
+        # publishes in flight on each slot
+        self._load = [0] * size
+        self._free = asyncio.Queue(loop=self._loop)
+        self._leases = {}
+        # the slots taken by acquire(), the publishes don't use them
+        self._leased = set()
+        self._replacing = {}
+        self._closed = False
+
+    @property
+    def channels(self):
+        return list(self._channels)
+
+    @asyncio.coroutine
+    def open(self):
+        """Open all the channels of the pool at once"""
+        self._channels = list((yield from asyncio.gather(
+            *[self._open_channel() for _ in range(self.size)], loop=self._loop)))
+        for index in range(self.size):
+            self._free.put_nowait(index)
+
+    @asyncio.coroutine
+    def _open_channel(self):
+        channel = yield from self.protocol.channel()
+        if self.publisher_confirms:
+            yield from channel.confirm_select()
+        return channel
+
+    @asyncio.coroutine
+    def _get_channel(self, index):
+        """Returns the channel of a slot, replacing it if it was closed"""
+        if self._closed:
+            raise exceptions.AioamqpException("the channel pool is closed")
+        channel = self._channels[index]
+        if channel.is_open:
+            return channel
+        task = self._replacing.get(index)
+        if task is None:
+            logger.info("Replacing the closed channel %d of the pool", channel.channel_id)
+            task = ensure_future(self._replace_channel(index), loop=self._loop)
+            self._replacing[index] = task
+            task.add_done_callback(lambda _: self._replacing.pop(index, None))
+        # the users of the slot share the replacement, none of them may cancel it
+        return (yield from asyncio.shield(task, loop=self._loop))
+
+    @asyncio.coroutine
+    def _replace_channel(self, index):
+        channel = yield from self._open_channel()
+        self._channels[index] = channel
+        return channel
+
+    @asyncio.coroutine
+    def acquire(self):
+        """Lease a channel for an exclusive use, waits until one is free
+
+        The channel must be given back with `release()`.
+        """
+        index = yield from self._free.get()
+        self._leased.add(index)
+        try:
+            channel = yield from self._get_channel(index)
+        except BaseException:
+            self._leased.discard(index)
+            self._free.put_nowait(index)
+            raise
+        self._leases[channel] = index
+        return channel
+
+    def release(self, channel):
+        """Give back a channel leased with `acquire()`"""
+        index = self._leases.pop(channel)
+        self._leased.discard(index)
+        self._free.put_nowait(index)
+
+    @asyncio.coroutine
+    def publish(self, payload, exchange_name, routing_key, properties=None, mandatory=False, immediate=False,
+                confirm_timeout=None):
+        """Publish a message on the least loaded channel which is not leased
+
+        The channel is shared by the publishes: several of them can be in flight on
+        the same channel, each one waiting for its own confirm. When every channel
+        is leased, the publish waits until one is released.
+        """
+        unleased = [index for index in range(self.size) if index not in self._leased]
+        if unleased:
+            index = min(unleased, key=self._load.__getitem__)
+            waited = False
+        else:
+            index = yield from self._free.get()
+            waited = True
+        self._load[index] += 1
+        try:
+            channel = yield from self._get_channel(index)
+            return (yield from channel.publish(
+                payload, exchange_name, routing_key, properties=properties, mandatory=mandatory,
+                immediate=immediate, confirm_timeout=confirm_timeout))
+        finally:
+            self._load[index] -= 1
+            if waited:
+                self._free.put_nowait(index)
+
+    @asyncio.coroutine
+    def close(self):
+        """Close all the open channels of the pool"""
+        self._closed = True
+        for task in list(self._replacing.values()):
+            task.cancel()
+        for channel in self._channels:
+            if channel.is_open:
+                try:
+                    yield from channel.close()
+                except exceptions.AioamqpException:
+                    logger.warning("Unable to close the channel %d", channel.channel_id, exc_info=True)
+
+    @property
+    def load(self):
+        """The number of publishes in flight on the pool"""
+        return sum(self._load)
+
+
+class ConnectionPool:
+    """A fixed number of connections, each one with its own ChannelPool
+
+    The connection `i` goes to `hosts[i % len(hosts)]`. The publishes go to the
+    connection with the fewest publishes in flight, and a lost connection is
+    reconnected in the background with an exponential backoff.
+    """
+
+    def __init__(self, hosts=('localhost',), size=2, channels_per_connection=10, publisher_confirms=False,
+                 reconnect_delay=0.5, max_reconnect_delay=30, *, loop=None, **connect_kwargs):
+        """
+            Args:
+                hosts:                      list of hosts or of (host, port) tuples
+                size:                       int, the number of connections
+                channels_per_connection:    int, the size of the channel pool of each connection
+                publisher_confirms:         bool, put the channels in confirm mode
+                reconnect_delay:            float, the first delay before reconnecting, in seconds
+                max_reconnect_delay:        float, the backoff stops growing at this delay
+                loop:                       the event loop to use
+                connect_kwargs:             arguments to be given to `aioamqp.connect()`
+        """
+        if not hosts:
+            raise ValueError("at least one host is required")
+        self._loop = loop or asyncio.get_event_loop()
+        self.hosts = [(host, None) if isinstance(host, str) else tuple(host) for host in hosts]
+        self.size = size
+        self.channels_per_connection = channels_per_connection
+        self.publisher_confirms = publisher_confirms
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.connect_kwargs = connect_kwargs
+        self._transports = [None] * size
+        self._protocols = [None] * size
+        self._channel_pools = [None] * size
+        self._watchers = []
+        self._leases = {}
+        self._closed = False
+
+    @property
+    def protocols(self):
+        """The connected AmqpProtocol instances"""
+        return [protocol for index, protocol in enumerate(self._protocols) if self._is_healthy(index)]
+
+    @asyncio.coroutine
+    def open(self):
+        """Open all the connections of the pool at once"""
+        results = yield from asyncio.gather(
+            *[self._connect(index) for index in range(self.size)], loop=self._loop, return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            for transport in self._transports:
+                if transport is not None:
+                    transport.close()
+            raise errors[0]
+        self._watchers = [
+            ensure_future(self._watch(index), loop=self._loop) for index in range(self.size)
+        ]
+
+    @asyncio.coroutine
+    def _connect(self, index):
+        # imported here, the aioamqp package imports this module
+        from . import connect
+
+        host, port = self.hosts[index % len(self.hosts)]
+        transport, protocol = yield from connect(host=host, port=port, loop=self._loop, **self.connect_kwargs)
+        try:
+            channel_pool = yield from protocol.channel_pool(
+                size=self.channels_per_connection, publisher_confirms=self.publisher_confirms)
+        except BaseException:
+            transport.close()
+            raise
+        self._transports[index] = transport
+        self._protocols[index] = protocol
+        self._channel_pools[index] = channel_pool
+
+    @asyncio.coroutine
+    def _watch(self, index):
+        """Reconnect the connection of a slot each time it is lost"""
+        while not self._closed:
+            yield from self._protocols[index].connection_closed.wait()
+            if self._closed:
+                return
+            logger.warning("Connection %d of the pool lost, reconnecting", index)
+            delay = self.reconnect_delay
+            while not self._closed:
+                try:
+                    yield from self._connect(index)
+                except asyncio.CancelledError:
+                    raise
+                except (OSError, exceptions.AioamqpException):
+                    logger.warning("Unable to reconnect the connection %d of the pool, retrying in %.1fs",
+                                   index, delay, exc_info=True)
+                except Exception:
+                    logger.exception("Unexpected error reconnecting the connection %d of the pool, "
+                                     "retrying in %.1fs", index, delay)
+                else:
+                    logger.info("Connection %d of the pool reconnected", index)
+                    break
+                yield from asyncio.sleep(delay, loop=self._loop)
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _is_healthy(self, index):
+        protocol = self._protocols[index]
+        return protocol is not None and not protocol.connection_closed.is_set()
+
+    def _least_loaded(self, key):
+        if self._closed:
+            raise exceptions.AioamqpException("the connection pool is closed")
+        healthy = [index for index in range(self.size) if self._is_healthy(index)]
+        if not healthy:
+            raise exceptions.AmqpClosedConnection()
+        return min(healthy, key=key)
+
+    @asyncio.coroutine
+    def publish(self, payload, exchange_name, routing_key, properties=None, mandatory=False, immediate=False,
+                confirm_timeout=None):
+        """Publish a message on the least loaded connection, see ChannelPool.publish()"""
+        index = self._least_loaded(lambda index: self._channel_pools[index].load)
+        return (yield from self._channel_pools[index].publish(
+            payload, exchange_name, routing_key, properties=properties, mandatory=mandatory,
+            immediate=immediate, confirm_timeout=confirm_timeout))
+
+    @asyncio.coroutine
+    def channel(self, **kwargs):
+        """Open a new channel on the connection with the fewest channels"""
+        index = self._least_loaded(lambda index: len(self._protocols[index].channels))
+        return (yield from self._protocols[index].channel(**kwargs))
+
+    @asyncio.coroutine
+    def acquire(self):
+        """Lease a pooled channel of the least loaded connection, see ChannelPool.acquire()"""
+        channel_pool = self._channel_pools[self._least_loaded(lambda index: self._channel_pools[index].load)]
+        channel = yield from channel_pool.acquire()
+        self._leases[channel] = channel_pool
+        return channel
+
+    def release(self, channel):
+        """Give back a channel leased with `acquire()`"""
+        self._leases.pop(channel).release(channel)
+
+    @asyncio.coroutine
+    def close(self):
+        """Close all the connections of the pool"""
+        self._closed = True
+        for watcher in self._watchers:
+            watcher.cancel()
+        self._watchers = []
+        for index in range(self.size):
+            if not self._is_healthy(index):
+                continue
+            protocol = self._protocols[index]
+            try:
+                yield from protocol.close()
+            except exceptions.AioamqpException:
+                logger.warning("Unable to close the connection %d of the pool", index, exc_info=True)
+            self._transports[index].close()
@@ -4,6 +4,7 @@
 
 import asyncio
 import logging
+import sys
 from time import time
 
 from . import channel as amqp_channel
@@ -11,16 +12,29 @@ from . import constants as amqp_constants
 from . import exceptions
 from . import frame as amqp_frame
 from . import version
-from .compat import ensure_future
+from .pool import ChannelPool
+from .reader import FrameReader
+from .scheduler import FrameScheduler
+from .timer import TimerWheel
+from .topology import TopologyCache
+from .compat import BufferedProtocol, ensure_future
 
 logger = logging.getLogger(__name__)
 
 
 CONNECTING, OPEN, CLOSING, CLOSED = range(4)
 
+# drain() cannot be called concurrently by multiple coroutines before python 3.10:
+# http://bugs.python.org/issue29930
+_DRAIN_LOCK_NEEDED = sys.version_info < (3, 10)
+
 
 class _StreamWriter(asyncio.StreamWriter):
 
+    def write_frame(self, channel, data, content=False):
+        """Write a frame, through the frame scheduler of the protocol"""
+        self._protocol._frame_scheduler.write_frame(channel, data, content)
+
     def write(self, data):
         ret = super().write(data)
         self._protocol._heartbeat_timer_send_reset()
@@ -31,13 +45,19 @@ class _StreamWriter(asyncio.StreamWriter):
         self._protocol._heartbeat_timer_send_reset()
         return ret
 
+    def close(self):
+        # the held back frames are written before the transport is closed
+        self._protocol._frame_scheduler.uncork()
+        return super().close()
+
     def write_eof(self):
+        self._protocol._frame_scheduler.uncork()
         ret = super().write_eof()
         self._protocol._heartbeat_timer_send_reset()
         return ret
 
 
-class AmqpProtocol(asyncio.StreamReaderProtocol):
+class AmqpProtocol(asyncio.StreamReaderProtocol, BufferedProtocol):
     """The AMQP protocol for asyncio.
 
     See http://docs.python.org/3.4/library/asyncio-protocol.html#protocols for more information
@@ -62,9 +82,18 @@ class AmqpProtocol(asyncio.StreamReaderProtocol):
                             Zero means the server does not want a heartbeat.
             loop: Asyncio.Eventloop: specify the eventloop to use.
             client_properties: dict, client-props to tune the client identification
+            topology_cache: bool, remember successful declarations and bindings so that
+                            identical ones don't go through the wire again.
+            write_coalescing: bool, write the frames of an event loop iteration with a single
+                            system call (True by default), False to write each frame at once.
+            blocked_timeout: float, while the broker blocks the connection, the publishes wait
+                            at most this delay before raising ConnectionBlocked, 0 to raise at once.
+                            None (the default) waits until the connection is unblocked.
         """
         self._loop = kwargs.get('loop') or asyncio.get_event_loop()
-        super().__init__(asyncio.StreamReader(loop=self._loop), loop=self._loop)
+        # python 3.8+ only keeps a weak reference to the reader
+        self._reader = FrameReader(loop=self._loop)
+        super().__init__(self._reader, loop=self._loop)
         self._on_error_callback = kwargs.get('on_error')
 
         self.client_properties = kwargs.get('client_properties', {})
@@ -96,11 +125,35 @@ class AmqpProtocol(asyncio.StreamReaderProtocol):
         self.server_channel_max = None
         self.channels_ids_ceil = 0
         self.channels_ids_free = set()
-        self._drain_lock = asyncio.Lock(loop=self._loop)
+        self._drain_lock = asyncio.Lock(loop=self._loop) if _DRAIN_LOCK_NEEDED else None
+        self._frame_scheduler = None
+        self._write_coalescing = kwargs.get('write_coalescing', True)
+        self.topology_cache = TopologyCache() if kwargs.get('topology_cache') else None
+        # shared by the timeouts of the publisher confirms, rpc calls and requests
+        self._timer_wheel = TimerWheel(self._loop)
+        # cleared while the broker blocks the connection (connection.blocked)
+        self.unblocked = asyncio.Event(loop=self._loop)
+        self.unblocked.set()
+        self.blocked_reason = None
+        self.blocked_timeout = kwargs.get('blocked_timeout')
+        self.blocked_count = 0
+        self._blocked_since = None
+        self._blocked_duration = 0.0
 
     def connection_made(self, transport):
         super().connection_made(transport)
         self._stream_writer = _StreamWriter(transport, self, self._stream_reader, self._loop)
+        self._frame_scheduler = FrameScheduler(
+            self._stream_writer.write, self._stream_writer.writelines, self._loop,
+            coalescing=self._write_coalescing)
+
+    def pause_writing(self):
+        super().pause_writing()
+        self._frame_scheduler.pause()
+
+    def resume_writing(self):
+        super().resume_writing()
+        self._frame_scheduler.resume()
 
     def eof_received(self):
         super().eof_received()
@@ -113,14 +166,28 @@ class AmqpProtocol(asyncio.StreamReaderProtocol):
         logger.warning("Connection lost exc=%r", exc)
         self.connection_closed.set()
         self.state = CLOSED
+        if self.topology_cache is not None:
+            self.topology_cache.clear()
         self._close_channels(exception=exc)
         self._heartbeat_stop()
+        self._timer_wheel.clear()
+        if self._frame_scheduler is not None:
+            self._frame_scheduler.clear()
+        # wake up the blocked publishers, they raise AmqpClosedConnection
+        self._set_unblocked()
         super().connection_lost(exc)
 
     def data_received(self, data):
         self._heartbeat_timer_recv_reset()
         super().data_received(data)
 
+    def get_buffer(self, sizehint):
+        return self._reader.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes):
+        self._heartbeat_timer_recv_reset()
+        self._reader.buffer_updated(nbytes)
+
     @asyncio.coroutine
     def ensure_open(self):
         # Raise a suitable exception if the connection isn't open.
@@ -142,18 +209,26 @@ class AmqpProtocol(asyncio.StreamReaderProtocol):
         raise exceptions.AioamqpException("connection isn't established yet.")
 
     @asyncio.coroutine
-    def _drain(self):
+    def _drain(self, channel_id=None):
+        """Wait for the frames of the channel (of all of them if None) to be written,
+        and for the transport buffer to be below its high water mark"""
+        flushed = self._frame_scheduler.wait_flushed(channel_id)
+        if flushed is not None:
+            yield from flushed
+        if self.state == OPEN and not self._frame_scheduler.paused:
+            # the transport buffer is below its high water mark: nothing to wait for
+            return
+        if self._drain_lock is None:
+            yield from self._stream_writer.drain()
+            return
         with (yield from self._drain_lock):
-            # drain() cannot be called concurrently by multiple coroutines:
-            # http://bugs.python.org/issue29930. Remove this lock when no
-            # version of Python where this bugs exists is supported anymore.
             yield from self._stream_writer.drain()
 
     @asyncio.coroutine
     def _write_frame(self, frame, request, drain=True):
         frame.write_frame(request)
         if drain:
-            yield from self._drain()
+            yield from self._drain(frame.channel)
 
     @asyncio.coroutine
     def close(self, no_wait=False, timeout=None):
@@ -212,7 +287,7 @@ class AmqpProtocol(asyncio.StreamReaderProtocol):
         client_properties = {
             'capabilities': {
                 'consumer_cancel_notify': True,
-                'connection.blocked': False,
+                'connection.blocked': True,
             },
             'copyright': 'BSD',
             'product': version.__package__,
@@ -283,6 +358,8 @@ class AmqpProtocol(asyncio.StreamReaderProtocol):
             (amqp_constants.CLASS_CONNECTION, amqp_constants.CONNECTION_TUNE): self.tune,
             (amqp_constants.CLASS_CONNECTION, amqp_constants.CONNECTION_START): self.start,
             (amqp_constants.CLASS_CONNECTION, amqp_constants.CONNECTION_OPEN_OK): self.open_ok,
+            (amqp_constants.CLASS_CONNECTION, amqp_constants.CONNECTION_BLOCKED): self.server_blocked,
+            (amqp_constants.CLASS_CONNECTION, amqp_constants.CONNECTION_UNBLOCKED): self.server_unblocked,
         }
         if not frame:
             frame = yield from self.get_frame()
@@ -450,6 +527,57 @@ class AmqpProtocol(asyncio.StreamReaderProtocol):
         self._close_ok()
         self._stream_writer.close()
 
+    @asyncio.coroutine
+    def server_blocked(self, frame):
+        """The broker stopped reading the publishes, because of a resource alarm"""
+        response = amqp_frame.AmqpDecoder(frame.payload)
+        self.blocked_reason = response.read_shortstr()
+        logger.warning("Connection blocked by the server: %s", self.blocked_reason)
+        if self.unblocked.is_set():
+            self.unblocked.clear()
+            self.blocked_count += 1
+            self._blocked_since = self._loop.time()
+
+    @asyncio.coroutine
+    def server_unblocked(self, frame):
+        """The broker reads the publishes again"""
+        logger.info("Connection unblocked by the server")
+        self._set_unblocked()
+
+    def _set_unblocked(self):
+        if self._blocked_since is not None:
+            self._blocked_duration += self._loop.time() - self._blocked_since
+            self._blocked_since = None
+        self.blocked_reason = None
+        self.unblocked.set()
+
+    @property
+    def is_blocked(self):
+        return not self.unblocked.is_set()
+
+    @property
+    def blocked_time(self):
+        """The total time the connection spent blocked, in seconds"""
+        if self._blocked_since is None:
+            return self._blocked_duration
+        return self._blocked_duration + self._loop.time() - self._blocked_since
+
+    @asyncio.coroutine
+    def wait_unblocked(self, timeout=None):
+        """Wait for the broker to unblock the connection
+
+            Raises ConnectionBlocked when it is still blocked after `timeout` seconds,
+            at once if `timeout` is 0.
+        """
+        if self.unblocked.is_set():
+            return
+        if timeout == 0:
+            raise exceptions.ConnectionBlocked(self.blocked_reason)
+        try:
+            yield from asyncio.wait_for(self.unblocked.wait(), timeout, loop=self._loop)
+        except asyncio.TimeoutError:
+            raise exceptions.ConnectionBlocked(self.blocked_reason)
+
     def _close_ok(self):
         frame = amqp_frame.AmqpRequest(self._stream_writer, amqp_constants.TYPE_METHOD, 0)
         frame.declare_method(
@@ -521,3 +649,15 @@ class AmqpProtocol(asyncio.StreamReaderProtocol):
         self.channels[channel_id] = channel
         yield from channel.open()
         return channel
+
+    @asyncio.coroutine
+    def channel_pool(self, size=10, **kwargs):
+        """Open a pool of `size` channels, see ChannelPool
+
+            Args:
+                size:       int, the number of channels
+                kwargs:     arguments to be given to `ChannelPool`, e.g. `publisher_confirms`
+        """
+        pool = ChannelPool(self, size=size, **kwargs)
+        yield from pool.open()
+        return pool
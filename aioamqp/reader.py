@@ -0,0 +1,115 @@
+"""
+    Frames reader, receiving the data straight into a reusable buffer
+"""
+
+import asyncio
+import struct
+
+from . import constants as amqp_constants
+
+
+# type, channel and size of a frame
+FRAME_HEADER = struct.Struct('!BHI')
+
+# the smallest room given to the transport to receive data into
+MIN_READ_SIZE = 16 * 1024
+
+
+class FrameReader(asyncio.StreamReader):
+    """StreamReader receiving the data into a preallocated buffer, and reading whole frames
+
+    With python 3.7+ the protocol is an asyncio.BufferedProtocol: the transport
+    receives the data straight into the buffer, see `get_buffer()` and
+    `buffer_updated()`. With older versions `feed_data()` copies it there.
+
+    The buffer is reused: the unread data is moved to its beginning when there is
+    no room left after it, and it grows when a frame doesn't fit in it. A frame
+    payload is the only copy of the received data.
+    """
+
+    def __init__(self, buffer_size=128 * 1024, **kwargs):
+        super().__init__(**kwargs)
+        self._recv_buffer = bytearray(buffer_size)
+        self._recv_view = memoryview(self._recv_buffer)
+        # the unread data is self._recv_buffer[self._start:self._end]
+        self._start = 0
+        self._end = 0
+        # the size of the frame being waited for
+        self._needed = 0
+
+    def _make_room(self, size):
+        unread = self._end - self._start
+        required = max(unread + size, self._needed)
+        if required > len(self._recv_buffer):
+            # the buffer is exported by self._recv_view, it can't be resized
+            recv_buffer = bytearray(max(required, 2 * len(self._recv_buffer)))
+            recv_buffer[:unread] = self._recv_view[self._start:self._end]
+            self._recv_buffer = recv_buffer
+            self._recv_view = memoryview(recv_buffer)
+        elif self._start:
+            self._recv_view[:unread] = self._recv_view[self._start:self._end]
+        self._start = 0
+        self._end = unread
+
+    def get_buffer(self, sizehint=-1):
+        """Returns the memoryview the transport receives the data into"""
+        size = max(sizehint, MIN_READ_SIZE)
+        if len(self._recv_buffer) - self._end < size:
+            self._make_room(size)
+        return self._recv_view[self._end:]
+
+    def buffer_updated(self, nbytes):
+        """The transport received `nbytes` into the buffer"""
+        self._end += nbytes
+        self._wakeup_waiter()
+        if (self._transport is not None and not self._paused and
+                self._end - self._start > 2 * self._limit):
+            try:
+                self._transport.pause_reading()
+            except NotImplementedError:
+                # the transport can't be paused
+                self._transport = None
+            else:
+                self._paused = True
+
+    def feed_data(self, data):
+        assert not self._eof, 'feed_data after feed_eof'
+        if not data:
+            return
+        size = len(data)
+        self.get_buffer(size)[:size] = data
+        self.buffer_updated(size)
+
+    def _maybe_resume_transport(self):
+        if self._paused and self._end - self._start <= self._limit:
+            self._paused = False
+            self._transport.resume_reading()
+
+    @asyncio.coroutine
+    def _wait_for_size(self, size):
+        while self._end - self._start < size:
+            if self._exception is not None:
+                raise self._exception
+            if self._eof:
+                partial = self._recv_view[self._start:self._end].tobytes()
+                self._start = self._end = 0
+                raise asyncio.IncompleteReadError(partial, size)
+            self._needed = size
+            yield from self._wait_for_data('read_frame')
+        self._needed = 0
+
+    @asyncio.coroutine
+    def read_frame(self):
+        """Returns the type, the channel and the payload (bytes) of the next frame"""
+        yield from self._wait_for_size(FRAME_HEADER.size)
+        frame_type, channel, size = FRAME_HEADER.unpack_from(self._recv_buffer, self._start)
+        yield from self._wait_for_size(FRAME_HEADER.size + size + 1)
+
+        start = self._start + FRAME_HEADER.size
+        payload = self._recv_view[start:start + size].tobytes()
+        assert self._recv_buffer[start + size] == amqp_constants.FRAME_END[0]
+        self._start = start + size + 1
+        if self._start == self._end:
+            self._start = self._end = 0
+        self._maybe_resume_transport()
+        return frame_type, channel, payload
@@ -0,0 +1,302 @@
+"""
+    Connection recovering its channels, topology and consumers after a reconnection
+"""
+
+import asyncio
+import inspect
+import logging
+import random
+from collections import OrderedDict
+
+from . import connect
+from . import exceptions
+from .channel import Channel
+from .compat import ensure_future
+
+
+logger = logging.getLogger(__name__)
+
+def _bind_arguments(method_name, args, kwargs):
+    """Returns the arguments of a Channel method call by name"""
+    signature = inspect.signature(getattr(Channel, method_name))
+    bound = signature.bind(None, *args, **kwargs)
+    bound.arguments.pop('self')
+    return bound.arguments
+
+
+class RobustChannel:
+    """Proxy of a Channel recording its topology, QoS and consumers
+
+    The declarations, bindings, QoS, publisher confirms and consumers made through
+    the proxy are replayed on a new channel when the connection is recovered (a
+    channel closed by the broker on a live connection is not). The other
+    attributes are those of the current channel.
+    """
+
+    def __init__(self, connection, channel):
+        self._connection = connection
+        self._channel = channel
+        # (method name, arguments), in the order of the calls
+        self._operations = []
+        self._qos = None
+        self._confirm_select = False
+        # consumer tag -> the arguments of basic_consume
+        self._consumers = OrderedDict()
+
+    def __getattr__(self, name):
+        return getattr(self._channel, name)
+
+    @property
+    def channel(self):
+        """The channel currently behind the proxy"""
+        return self._channel
+
+    @asyncio.coroutine
+    def _recorded_call(self, method_name, args, kwargs):
+        arguments = _bind_arguments(method_name, args, kwargs)
+        result = yield from getattr(self._channel, method_name)(**arguments)
+        if not arguments.get('passive'):
+            if method_name == 'queue_declare' and not arguments.get('queue_name'):
+                # the replay declares it again and renames it
+                arguments['server_named'] = result['queue']
+            self._operations.append((method_name, arguments))
+        return result
+
+    @asyncio.coroutine
+    def exchange_declare(self, *args, **kwargs):
+        return (yield from self._recorded_call('exchange_declare', args, kwargs))
+
+    @asyncio.coroutine
+    def queue_declare(self, *args, **kwargs):
+        return (yield from self._recorded_call('queue_declare', args, kwargs))
+
+    @asyncio.coroutine
+    def exchange_bind(self, *args, **kwargs):
+        return (yield from self._recorded_call('exchange_bind', args, kwargs))
+
+    @asyncio.coroutine
+    def queue_bind(self, *args, **kwargs):
+        return (yield from self._recorded_call('queue_bind', args, kwargs))
+
+    def _forget(self, predicate):
+        self._operations = [
+            (method_name, arguments) for method_name, arguments in self._operations
+            if not predicate(method_name, arguments)
+        ]
+
+    @asyncio.coroutine
+    def exchange_delete(self, exchange_name, *args, **kwargs):
+        result = yield from self._channel.exchange_delete(exchange_name, *args, **kwargs)
+        self._forget(lambda method_name, arguments: exchange_name in (
+            arguments.get('exchange_name'), arguments.get('exchange_source'),
+            arguments.get('exchange_destination')))
+        return result
+
+    @asyncio.coroutine
+    def queue_delete(self, queue_name, *args, **kwargs):
+        result = yield from self._channel.queue_delete(queue_name, *args, **kwargs)
+        self._forget(lambda method_name, arguments: queue_name in (
+            arguments.get('queue_name'), arguments.get('server_named')))
+        return result
+
+    @asyncio.coroutine
+    def exchange_unbind(self, *args, **kwargs):
+        result = yield from self._channel.exchange_unbind(*args, **kwargs)
+        unbound = _bind_arguments('exchange_unbind', args, kwargs)
+        self._forget(lambda method_name, arguments: method_name == 'exchange_bind' and all(
+            arguments.get(name) == unbound.get(name)
+            for name in ('exchange_destination', 'exchange_source', 'routing_key')))
+        return result
+
+    @asyncio.coroutine
+    def queue_unbind(self, *args, **kwargs):
+        result = yield from self._channel.queue_unbind(*args, **kwargs)
+        unbound = _bind_arguments('queue_unbind', args, kwargs)
+        self._forget(lambda method_name, arguments: method_name == 'queue_bind' and all(
+            arguments.get(name) == unbound.get(name) for name in ('queue_name', 'exchange_name', 'routing_key')))
+        return result
+
+    @asyncio.coroutine
+    def basic_qos(self, *args, **kwargs):
+        result = yield from self._channel.basic_qos(*args, **kwargs)
+        self._qos = _bind_arguments('basic_qos', args, kwargs)
+        return result
+
+    @asyncio.coroutine
+    def confirm_select(self, *args, **kwargs):
+        result = yield from self._channel.confirm_select(*args, **kwargs)
+        self._confirm_select = True
+        return result
+
+    @asyncio.coroutine
+    def basic_consume(self, callback, *args, **kwargs):
+        arguments = _bind_arguments('basic_consume', (callback,) + args, kwargs)
+        # the callback receives the proxy, it is still valid after a reconnection
+        arguments['callback'] = self._consumer_callback(callback)
+        result = yield from self._channel.basic_consume(**arguments)
+        arguments['consumer_tag'] = result['consumer_tag']
+        self._consumers[result['consumer_tag']] = arguments
+        return result
+
+    def _consumer_callback(self, callback):
+        @asyncio.coroutine
+        def wrapper(_channel, body, envelope, properties):
+            yield from callback(self, body, envelope, properties)
+        return wrapper
+
+    @asyncio.coroutine
+    def basic_cancel(self, consumer_tag, *args, **kwargs):
+        self._consumers.pop(consumer_tag, None)
+        return (yield from self._channel.basic_cancel(consumer_tag, *args, **kwargs))
+
+    @asyncio.coroutine
+    def close(self, *args, **kwargs):
+        self._connection._channels.discard(self)
+        return (yield from self._channel.close(*args, **kwargs))
+
+    def _rename_queue(self, old_name, new_name):
+        for _method_name, arguments in self._operations:
+            if arguments.get('queue_name') == old_name:
+                arguments['queue_name'] = new_name
+            if arguments.get('server_named') == old_name:
+                arguments['server_named'] = new_name
+        for arguments in self._consumers.values():
+            if arguments.get('queue_name') == old_name:
+                arguments['queue_name'] = new_name
+
+    @asyncio.coroutine
+    def _recover(self, channel):
+        """Replay the recorded operations on a new channel
+
+        The operations are pipelined with no_wait, the basic.qos which follows
+        them is a fence: its response means they all succeeded.
+        """
+        self._channel = channel
+        for method_name, arguments in list(self._operations):
+            arguments = dict(arguments)
+            server_named = arguments.pop('server_named', None)
+            if server_named is not None:
+                # the server gives it a new name, which the next operations need
+                arguments['no_wait'] = False
+                result = yield from channel.queue_declare(**arguments)
+                self._rename_queue(server_named, result['queue'])
+                continue
+            arguments['no_wait'] = True
+            yield from getattr(channel, method_name)(**arguments)
+
+        yield from channel.basic_qos(**(self._qos or {}))
+
+        for arguments in self._consumers.values():
+            yield from channel.basic_consume(**dict(arguments, no_wait=True))
+        if self._confirm_select:
+            yield from channel.confirm_select()
+
+
+class RobustConnection:
+    """A connection reconnecting by itself, and recovering its channels
+
+    The channels are RobustChannel proxies: after a reconnection their topology,
+    QoS and consumers are replayed on new channels. The reconnection attempts
+    are spaced by a jittered exponential backoff.
+    """
+
+    def __init__(self, host='localhost', port=None, reconnect_delay=0.5, max_reconnect_delay=30, *,
+                 loop=None, **connect_kwargs):
+        """
+            Args:
+                host:                   str, the host to connect to
+                port:                   int, the broker port
+                reconnect_delay:        float, the first delay before reconnecting, in seconds
+                max_reconnect_delay:    float, the backoff stops growing at this delay
+                loop:                   the event loop to use
+                connect_kwargs:         arguments to be given to `aioamqp.connect()`
+        """
+        self._loop = loop or asyncio.get_event_loop()
+        self.host = host
+        self.port = port
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.connect_kwargs = connect_kwargs
+        self.transport = None
+        self.protocol = None
+        self.reconnects = 0
+        self.connected = asyncio.Event(loop=self._loop)
+        self._channels = set()
+        self._watcher = None
+        self._closing = False
+
+    @asyncio.coroutine
+    def _connect(self):
+        self.transport, self.protocol = yield from connect(
+            host=self.host, port=self.port, loop=self._loop, **self.connect_kwargs)
+
+    @asyncio.coroutine
+    def connect(self):
+        """Connect to the broker, the next reconnections are automatic"""
+        yield from self._connect()
+        self.connected.set()
+        self._watcher = ensure_future(self._watch(), loop=self._loop)
+
+    @asyncio.coroutine
+    def channel(self):
+        """Open a RobustChannel"""
+        channel = RobustChannel(self, (yield from self.protocol.channel()))
+        self._channels.add(channel)
+        return channel
+
+    def _backoff(self, attempt):
+        delay = min(self.reconnect_delay * 2 ** attempt, self.max_reconnect_delay)
+        # spread the reconnections of the clients of a restarted broker
+        return random.uniform(delay / 2, delay)
+
+    @asyncio.coroutine
+    def _watch(self):
+        while True:
+            yield from self.protocol.connection_closed.wait()
+            self.connected.clear()
+            if self._closing:
+                return
+            logger.warning("Connection lost, reconnecting")
+            attempt = 0
+            while not self._closing:
+                try:
+                    yield from self._connect()
+                    yield from self._recover()
+                except asyncio.CancelledError:
+                    raise
+                except (OSError, exceptions.AioamqpException):
+                    delay = self._backoff(attempt)
+                    logger.warning("Unable to recover the connection, retrying in %.2fs", delay, exc_info=True)
+                except Exception:
+                    delay = self._backoff(attempt)
+                    logger.exception("Unexpected error recovering the connection, retrying in %.2fs", delay)
+                else:
+                    self.reconnects += 1
+                    self.connected.set()
+                    logger.info("Connection recovered")
+                    break
+                attempt += 1
+                if self.transport is not None:
+                    self.transport.close()
+                yield from asyncio.sleep(delay, loop=self._loop)
+
+    @asyncio.coroutine
+    def _recover(self):
+        channels = list(self._channels)
+        new_channels = yield from asyncio.gather(
+            *[self.protocol.channel() for _ in channels], loop=self._loop)
+        yield from asyncio.gather(
+            *[channel._recover(new_channel) for channel, new_channel in zip(channels, new_channels)],
+            loop=self._loop)
+
+    @asyncio.coroutine
+    def close(self):
+        """Close the connection, and stop reconnecting"""
+        self._closing = True
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+        if self.protocol is not None and not self.protocol.connection_closed.is_set():
+            yield from self.protocol.close()
+            self.transport.close()
+        self.connected.clear()
@@ -0,0 +1,317 @@
+"""
+    Remote procedure calls over AMQP
+"""
+
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+
+from . import exceptions
+from .compat import ensure_future
+from .constants import MESSAGE_PROPERTIES
+from .consumer import BoundedDispatcher
+from .properties import Properties
+
+
+logger = logging.getLogger(__name__)
+
+# RabbitMQ pseudo-queue: replies are sent straight to the consumer, no queue is declared
+DIRECT_REPLY_TO = 'amq.rabbitmq.reply-to'
+
+# header carrying the error raised by the handler of a request
+ERROR_HEADER = 'x-rpc-error'
+
+
+class RpcClient:
+    """Issue concurrent RPC calls over a single channel
+
+    The replies are consumed from RabbitMQ's direct reply-to pseudo-queue and are
+    matched to the pending calls with their `correlation_id` property.
+    """
+
+    def __init__(self, channel, timeout=None):
+        """
+            Args:
+                channel:    Channel, the channel used to publish the requests
+                            and to consume the replies
+                timeout:    float, default timeout of the calls, in seconds
+        """
+        self._loop = channel._loop
+        self.channel = channel
+        self.timeout = timeout
+        self.consumer_tag = None
+        self._futures = {}
+        self._close_watcher = None
+
+    @asyncio.coroutine
+    def start(self):
+        """Start consuming the replies, must be called before the first call"""
+        result = yield from self.channel.basic_consume(
+            self._on_reply, queue_name=DIRECT_REPLY_TO, no_ack=True)
+        self.consumer_tag = result['consumer_tag']
+        self._close_watcher = ensure_future(self._watch_channel_close(), loop=self._loop)
+
+    @asyncio.coroutine
+    def stop(self):
+        """Stop consuming the replies, the pending calls are cancelled"""
+        if self._close_watcher is not None:
+            self._close_watcher.cancel()
+            self._close_watcher = None
+        self._fail_pending(None)
+        if self.consumer_tag is not None and self.channel.is_open:
+            yield from self.channel.basic_cancel(self.consumer_tag)
+        self.consumer_tag = None
+
+    @property
+    def pending_calls(self):
+        return len(self._futures)
+
+    @asyncio.coroutine
+    def call(self, payload, exchange_name, routing_key, properties=None, timeout=None):
+        """Publish a request and wait for its reply
+
+            Args:
+                payload:        str or bytes, the request body
+                exchange_name:  str, the exchange to publish the request to
+                routing_key:    str, the routing key of the request
+                properties:     dict or Properties, extra properties of the request.
+                                EncodedProperties are encoded again, with the
+                                correlation_id and reply_to of the call
+                timeout:        float, overrides the client's default timeout
+
+            Returns:            the body of the reply
+
+            Raises RpcError if the handler of the request failed.
+        """
+        if self.consumer_tag is None:
+            raise exceptions.AioamqpException("the rpc client is not started")
+
+        correlation_id = uuid.uuid4().hex
+        if isinstance(properties, Properties):
+            properties = {
+                name: getattr(properties, name) for name in MESSAGE_PROPERTIES
+                if getattr(properties, name) is not None
+            }
+        else:
+            properties = dict(properties or {})
+        properties['correlation_id'] = correlation_id
+        properties['reply_to'] = DIRECT_REPLY_TO
+
+        fut = asyncio.Future(loop=self._loop)
+        self._futures[correlation_id] = fut
+        if timeout is None:
+            timeout = self.timeout
+        timeout_handle = None
+        if timeout is not None:
+            timeout_handle = self.channel.protocol._timer_wheel.call_later(timeout, self._expire, correlation_id)
+        try:
+            yield from self.channel.publish(payload, exchange_name, routing_key, properties)
+            return (yield from fut)
+        finally:
+            self._futures.pop(correlation_id, None)
+            if timeout_handle is not None:
+                timeout_handle.cancel()
+
+    @asyncio.coroutine
+    def _on_reply(self, channel, body, envelope, properties):
+        fut = self._futures.pop(properties.correlation_id, None)
+        if fut is None:
+            logger.debug("Dropping the reply to an unknown call %r", properties.correlation_id)
+            return
+        if fut.done():
+            return
+        headers = properties.headers or {}
+        if ERROR_HEADER in headers:
+            fut.set_exception(exceptions.RpcError(headers[ERROR_HEADER]))
+        else:
+            fut.set_result(body)
+
+    def _expire(self, correlation_id):
+        fut = self._futures.pop(correlation_id, None)
+        if fut is not None and not fut.done():
+            fut.set_exception(asyncio.TimeoutError())
+
+    def _fail_pending(self, exception):
+        futures, self._futures = self._futures, {}
+        for fut in futures.values():
+            if fut.done():
+                continue
+            if exception is None:
+                fut.cancel()
+            else:
+                fut.set_exception(exception)
+
+    @asyncio.coroutine
+    def _watch_channel_close(self):
+        yield from self.channel.close_event.wait()
+        self._fail_pending(exceptions.ChannelClosed())
+        self.consumer_tag = None
+
+
+class RpcMetrics:
+    """Counters of an RpcServer, the times are in seconds"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.acks_sent = 0
+        self.handling_time = 0.0
+        self.max_handling_time = 0.0
+
+    @property
+    def mean_handling_time(self):
+        handled = self.requests - self.in_flight
+        return self.handling_time / handled if handled else 0.0
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'in_flight': self.in_flight,
+            'acks_sent': self.acks_sent,
+            'handling_time': self.handling_time,
+            'max_handling_time': self.max_handling_time,
+            'mean_handling_time': self.mean_handling_time,
+        }
+
+
+class RpcServer:
+    """Serve the RPC requests consumed from a queue
+
+    The handler is a coroutine function called with `(body, envelope, properties)`
+    which returns the body of the reply. Up to `concurrency` requests are handled
+    at the same time, their replies are published to their `reply_to` with their
+    `correlation_id`, and the acknowledgements are coalesced.
+
+    A run of requests done is acknowledged at once with `multiple=True` only when
+    every delivery tag up to the last one was delivered to this server: the other
+    consumers of the channel get their messages acknowledged one by one.
+    """
+
+    def __init__(self, channel, handler, concurrency=100, timeout=None):
+        """
+            Args:
+                channel:        Channel, the channel used to consume the requests
+                                and to publish the replies
+                handler:        coroutine function, computes the reply of a request
+                concurrency:    int, the maximum number of requests handled at the same time
+                timeout:        float, the handler is cancelled after `timeout` seconds
+                                and an error is sent back
+        """
+        self._loop = channel._loop
+        self.channel = channel
+        self.handler = handler
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.consumer_tag = None
+        self.metrics = RpcMetrics()
+        self._dispatcher = BoundedDispatcher(channel, concurrency)
+        # delivery tag -> whether the request is done, in delivery order
+        self._unacked = OrderedDict()
+        self._ack_scheduled = False
+        # every delivery tag up to this one was delivered to this server
+        self._contiguous_tag = 0
+
+    @asyncio.coroutine
+    def start(self, queue_name):
+        """Start consuming the requests from `queue_name`"""
+        yield from self._dispatcher.set_qos()
+        result = yield from self.channel.basic_consume(self._on_request, queue_name=queue_name)
+        self.consumer_tag = result['consumer_tag']
+
+    @asyncio.coroutine
+    def stop(self):
+        """Stop consuming, and wait for the requests being handled"""
+        if self.consumer_tag is not None and self.channel.is_open:
+            yield from self.channel.basic_cancel(self.consumer_tag)
+        self.consumer_tag = None
+        yield from self._dispatcher.wait()
+        yield from self._flush_acks()
+
+    @asyncio.coroutine
+    def _on_request(self, channel, body, envelope, properties):
+        self._unacked[envelope.delivery_tag] = False
+        if envelope.delivery_tag == self._contiguous_tag + 1:
+            self._contiguous_tag = envelope.delivery_tag
+        self.metrics.requests += 1
+        self.metrics.in_flight += 1
+        yield from self._dispatcher.dispatch(self._handle(body, envelope, properties))
+
+    @asyncio.coroutine
+    def _handle(self, body, envelope, properties):
+        start = self._loop.time()
+        reply_properties = {'correlation_id': properties.correlation_id}
+        handler_task = ensure_future(self.handler(body, envelope, properties), loop=self._loop)
+        timer = None
+        if self.timeout is not None:
+            timer = self.channel.protocol._timer_wheel.call_later(self.timeout, handler_task.cancel)
+        try:
+            try:
+                reply = yield from handler_task
+            except asyncio.CancelledError:
+                if timer is None or not timer.fired():
+                    raise
+                logger.warning("Timeout while handling the request %r", properties.correlation_id)
+                self.metrics.errors += 1
+                reply = repr(asyncio.TimeoutError())
+                reply_properties['headers'] = {ERROR_HEADER: reply}
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.exception("Error while handling the request %r", properties.correlation_id)
+                self.metrics.errors += 1
+                reply = repr(exc)
+                reply_properties['headers'] = {ERROR_HEADER: reply}
+            finally:
+                if timer is not None:
+                    timer.cancel()
+
+            if properties.reply_to:
+                yield from self.channel.publish(reply, '', properties.reply_to, reply_properties)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Unable to reply to the request %r", properties.correlation_id)
+        finally:
+            elapsed = self._loop.time() - start
+            self.metrics.in_flight -= 1
+            self.metrics.handling_time += elapsed
+            self.metrics.max_handling_time = max(self.metrics.max_handling_time, elapsed)
+            self._settle(envelope.delivery_tag)
+
+    def _settle(self, delivery_tag):
+        if delivery_tag not in self._unacked:
+            return
+        self._unacked[delivery_tag] = True
+        if not self._ack_scheduled:
+            # let the other requests done during this loop iteration join the acknowledgement
+            self._ack_scheduled = True
+            ensure_future(self._flush_acks(), loop=self._loop)
+
+    @asyncio.coroutine
+    def _flush_acks(self):
+        self._ack_scheduled = False
+        # the longest run of done requests is acknowledged at once, the
+        # others can't wait for the slow requests delivered before them
+        run = []
+        while self._unacked:
+            delivery_tag, done = next(iter(self._unacked.items()))
+            if not done:
+                break
+            self._unacked.popitem(last=False)
+            run.append(delivery_tag)
+        # no delivery of another consumer of the channel is acknowledged with them
+        at_once = [delivery_tag for delivery_tag in run if delivery_tag <= self._contiguous_tag]
+        multiple_tag = at_once[-1] if at_once else None
+        single_tags = run[len(at_once):]
+        single_tags.extend(delivery_tag for delivery_tag, done in self._unacked.items() if done)
+        for delivery_tag in single_tags:
+            self._unacked.pop(delivery_tag, None)
+
+        try:
+            if multiple_tag is not None:
+                yield from self.channel.basic_client_ack(multiple_tag, multiple=True)
+                self.metrics.acks_sent += 1
+            for delivery_tag in single_tags:
+                yield from self.channel.basic_client_ack(delivery_tag)
+                self.metrics.acks_sent += 1
+        except exceptions.AioamqpException:
+            logger.warning("Unable to acknowledge the requests", exc_info=True)
@@ -0,0 +1,171 @@
+"""
+    Outbound frames scheduler, interleaving the channels while the transport is paused
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict, deque
+
+from . import constants as amqp_constants
+
+
+logger = logging.getLogger(__name__)
+
+# the held back frames are written at once above this size, in bytes
+COALESCING_LIMIT = 64 * 1024
+
+
+def is_content(frame_type, class_id=None, method_id=None):
+    """Whether a frame belongs to a content (basic.publish, its header and body frames)
+
+    The other frames of a channel are control frames: acks, rejects, declarations...
+    """
+    if frame_type in (amqp_constants.TYPE_HEADER, amqp_constants.TYPE_BODY):
+        return True
+    return (class_id, method_id) == (amqp_constants.CLASS_BASIC, amqp_constants.BASIC_PUBLISH)
+
+
+class FrameScheduler:
+    """Queues the frames per channel while the transport doesn't accept more data
+
+    While the transport is writable and nothing is queued, the frames are held back
+    until the end of the loop iteration and written with a single `writelines()`:
+    one system call for all the acks and small publishes of the iteration. They are
+    written at once when `coalescing` is False, or when they add up to
+    `coalescing_limit` bytes.
+
+    When the transport pauses the protocol (its buffer is above the high water
+    mark), the frames are queued per channel, and written when it resumes it:
+
+    - the frames of the channel 0 (heartbeats, connection methods) first,
+    - then the channels whose next frame is a control frame,
+    - then one frame of each channel in turn: a large message doesn't hold back
+      the small messages of the other channels until it has been fully sent.
+
+    The frames of a channel keep their order: the frames of a content are never
+    interleaved with other frames of the same channel.
+    """
+
+    def __init__(self, write, writelines, loop, coalescing=True, coalescing_limit=COALESCING_LIMIT):
+        """
+            Args:
+                write:              function writing bytes to the transport
+                writelines:         function writing a list of bytes to the transport
+                loop:               the event loop
+                coalescing:         bool, write the frames of a loop iteration together
+                coalescing_limit:   int, write the held back frames at once above this size
+        """
+        self._write = write
+        self._writelines = writelines
+        self._loop = loop
+        self.coalescing = coalescing
+        self.coalescing_limit = coalescing_limit
+        self.paused = False
+        # the frames held back until the end of the loop iteration
+        self._corked = []
+        self._corked_size = 0
+        self._uncork_handle = None
+        # channel -> deque of (frame, content), in round-robin order
+        self._queues = OrderedDict()
+        self._backlog_size = 0
+        # channel (None for all) -> futures resolved when its frames are written
+        self._waiters = {}
+
+    @property
+    def backlog(self):
+        """The number of bytes queued"""
+        return self._backlog_size
+
+    def write_frame(self, channel, frame, content=False):
+        if not self.paused and not self._queues:
+            if not self.coalescing:
+                self._write(frame)
+                return
+            self._corked.append(frame)
+            self._corked_size += len(frame)
+            if self._corked_size >= self.coalescing_limit:
+                self.uncork()
+            elif self._uncork_handle is None:
+                self._uncork_handle = self._loop.call_soon(self.uncork)
+            return
+        queue = self._queues.get(channel)
+        if queue is None:
+            queue = self._queues[channel] = deque()
+        queue.append((frame, content))
+        self._backlog_size += len(frame)
+
+    def uncork(self):
+        """Write the held back frames"""
+        if self._uncork_handle is not None:
+            self._uncork_handle.cancel()
+            self._uncork_handle = None
+        if not self._corked:
+            return
+        frames = self._corked
+        self._corked = []
+        self._corked_size = 0
+        # may pause the writing, the next frames are queued
+        self._writelines(frames)
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+        self.flush()
+
+    def _next_channel(self):
+        if 0 in self._queues:
+            return 0
+        for channel, queue in self._queues.items():
+            if not queue[0][1]:
+                return channel
+        return next(iter(self._queues))
+
+    def flush(self):
+        """Write the queued frames until the transport pauses again"""
+        while self._queues and not self.paused:
+            channel = self._next_channel()
+            queue = self._queues.pop(channel)
+            frame, _content = queue.popleft()
+            self._backlog_size -= len(frame)
+            if queue:
+                # to the back of the round-robin
+                self._queues[channel] = queue
+            else:
+                self._wake_up(channel)
+            # may pause the writing again
+            self._write(frame)
+        if not self._queues:
+            self._wake_up(None)
+
+    def _wake_up(self, channel):
+        for waiter in self._waiters.pop(channel, ()):
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def wait_flushed(self, channel=None):
+        """Returns a future resolved once the frames queued for `channel` (all of
+        them if None) are written, None if there are none"""
+        if channel is None:
+            if not self._queues:
+                return None
+        elif channel not in self._queues:
+            return None
+        waiter = asyncio.Future(loop=self._loop)
+        self._waiters.setdefault(channel, []).append(waiter)
+        return waiter
+
+    def clear(self):
+        """Drop the queued frames, the connection is lost"""
+        if self._queues or self._corked:
+            logger.debug("Dropping %d bytes of queued frames", self._backlog_size + self._corked_size)
+        self._queues.clear()
+        self._backlog_size = 0
+        if self._uncork_handle is not None:
+            self._uncork_handle.cancel()
+            self._uncork_handle = None
+        self._corked = []
+        self._corked_size = 0
+        for channel in list(self._waiters):
+            self._wake_up(channel)
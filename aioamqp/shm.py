@@ -0,0 +1,161 @@
+"""
+    Hand the message bodies to worker processes through shared memory
+"""
+
+import contextlib
+import logging
+import sys
+import threading
+
+try:
+    from multiprocessing import resource_tracker
+    from multiprocessing import shared_memory
+except ImportError:  # python < 3.8
+    resource_tracker = shared_memory = None
+
+
+logger = logging.getLogger(__name__)
+
+# held while resource_tracker.register is swapped, see _attach()
+_register_lock = threading.Lock()
+
+
+def _attach(name):
+    """Open an existing segment, without registering it to the resource tracker
+
+    The segment belongs to the pool which created it: a tracker would unlink it
+    when the process attaching it exits (https://bugs.python.org/issue38119),
+    and the worker processes share the tracker of their parent.
+
+    Before python 3.13 the registration is skipped by swapping the module-level
+    `resource_tracker.register`, under `_register_lock`: the threads attaching
+    concurrently don't save the swapped function as the original one, and the
+    segments created by SharedMemoryPool are still registered. Unregistering after
+    attaching would drop the registration of the creator from the shared tracker.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    with _register_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+class SharedBody:
+    """The descriptor of a message body held in a shared memory segment
+
+    It is small and picklable, it is what is sent to the worker processes.
+    """
+    __slots__ = ('name', 'size')
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+
+    def __getstate__(self):
+        return (self.name, self.size)
+
+    def __setstate__(self, state):
+        self.name, self.size = state
+
+    def __repr__(self):
+        return '<SharedBody %s %d bytes>' % (self.name, self.size)
+
+    @contextlib.contextmanager
+    def attach(self):
+        """Context manager giving a read-only memoryview of the body, without copying it"""
+        segment = _attach(self.name)
+        view = segment.buf[:self.size].toreadonly()
+        try:
+            yield view
+        finally:
+            view.release()
+            segment.close()
+
+    def read(self):
+        """Returns a copy of the body as bytes"""
+        with self.attach() as view:
+            return view.tobytes()
+
+
+class SharedMemoryPool:
+    """Reusable shared memory segments to assemble the message bodies into
+
+    `body_allocator` is meant as the `body_allocator` of `Channel.basic_consume()`:
+    the bodies of at least `min_size` bytes are written into a segment and the
+    consumer callback receives a SharedBody. The segment must be given back with
+    `release()` once the message is acknowledged.
+
+    The segment sizes are rounded up to a power of two, and up to `max_free`
+    segments of each size are kept for reuse.
+    """
+
+    def __init__(self, min_size=64 * 1024, max_free=8):
+        """
+            Args:
+                min_size:   int, the smaller bodies are kept as bytes
+                max_free:   int, the number of free segments kept for each size
+        """
+        if shared_memory is None:
+            raise NotImplementedError('Shared memory needs Python 3.8 or later')
+        self.min_size = min_size
+        self.max_free = max_free
+        self._free = {}
+        self._used = {}
+
+    @property
+    def segments_used(self):
+        return len(self._used)
+
+    def _segment_size(self, size):
+        segment_size = self.min_size
+        while segment_size < size:
+            segment_size *= 2
+        return segment_size
+
+    def allocate(self, size):
+        """Returns a segment of at least `size` bytes and its SharedBody"""
+        segment_size = self._segment_size(size)
+        free = self._free.get(segment_size)
+        if free:
+            segment = free.pop()
+        else:
+            # not while a thread attaching a segment skips the registration
+            with _register_lock:
+                segment = shared_memory.SharedMemory(create=True, size=segment_size)
+        body = SharedBody(segment.name, size)
+        self._used[segment.name] = (segment, segment_size)
+        return segment, body
+
+    def body_allocator(self, body_size, envelope, properties):
+        if body_size < self.min_size:
+            return None
+        segment, body = self.allocate(body_size)
+        return segment.buf, body
+
+    def release(self, body):
+        """Give back the segment of a SharedBody, once its message is settled"""
+        segment, segment_size = self._used.pop(body.name)
+        free = self._free.setdefault(segment_size, [])
+        if len(free) < self.max_free:
+            free.append(segment)
+        else:
+            segment.close()
+            segment.unlink()
+
+    def close(self):
+        """Free all the segments, the ones in use included"""
+        segments = [segment for segment, _segment_size in self._used.values()]
+        for free in self._free.values():
+            segments.extend(free)
+        self._used.clear()
+        self._free.clear()
+        for segment in segments:
+            segment.close()
+            try:
+                segment.unlink()
+            except FileNotFoundError:
+                logger.debug("Segment %s already unlinked", segment.name)
@@ -0,0 +1,146 @@
+"""
+    A socket-level stand-in for an AMQP broker, for the tests which don't need RabbitMQ
+
+    It handles the connection handshake, the opening and the closing of the
+    channels and of the connection, the consumptions, and records the other
+    frames it receives.
+"""
+
+import asyncio
+import io
+import struct
+
+from .. import constants as amqp_constants
+from ..frame import AmqpDecoder, AmqpEncoder
+
+
+def method_frame(channel, class_id, method_id, encoder=None):
+    payload = struct.pack('!HH', class_id, method_id)
+    if encoder is not None:
+        payload += encoder.payload.getvalue()
+    return struct.pack('!BHI', amqp_constants.TYPE_METHOD, channel, len(payload)) + payload + amqp_constants.FRAME_END
+
+
+class FakeConnection:
+
+    def __init__(self, broker, reader, writer):
+        self.broker = broker
+        self.reader = reader
+        self.writer = writer
+        self.virtualhost = None
+
+    def send_method(self, channel, class_id, method_id, encoder=None):
+        self.writer.write(method_frame(channel, class_id, method_id, encoder))
+
+    def deliver(self, channel, consumer_tag, delivery_tag, body):
+        """Send a basic.deliver, its content header and its body"""
+        encoder = AmqpEncoder()
+        encoder.write_shortstr(consumer_tag)
+        encoder.write_long_long(delivery_tag)
+        encoder.write_bits(False)
+        encoder.write_shortstr('')
+        encoder.write_shortstr('routing_key')
+        self.send_method(channel, amqp_constants.CLASS_BASIC, amqp_constants.BASIC_DELIVER, encoder)
+        header = struct.pack('!HHQH', amqp_constants.CLASS_BASIC, 0, len(body), 0)
+        for frame_type, payload in ((amqp_constants.TYPE_HEADER, header), (amqp_constants.TYPE_BODY, body)):
+            self.writer.write(
+                struct.pack('!BHI', frame_type, channel, len(payload)) + payload + amqp_constants.FRAME_END)
+
+    @asyncio.coroutine
+    def run(self):
+        header = yield from self.reader.readexactly(len(amqp_constants.PROTOCOL_HEADER))
+        if header != amqp_constants.PROTOCOL_HEADER:
+            self.writer.close()
+            return
+        encoder = AmqpEncoder()
+        encoder.write_octet(0)
+        encoder.write_octet(9)
+        encoder.write_table({'capabilities': self.broker.capabilities})
+        encoder.write_longstr('AMQPLAIN PLAIN')
+        encoder.write_longstr('en_US')
+        self.send_method(0, amqp_constants.CLASS_CONNECTION, amqp_constants.CONNECTION_START, encoder)
+        try:
+            while True:
+                frame_type, channel, size = struct.unpack('!BHI', (yield from self.reader.readexactly(7)))
+                payload = yield from self.reader.readexactly(size + 1)
+                self.broker.frames.append((frame_type, channel, payload[:-1]))
+                if frame_type == amqp_constants.TYPE_METHOD:
+                    class_id, method_id = struct.unpack('!HH', payload[:4])
+                    self.on_method(channel, class_id, method_id, AmqpDecoder(io.BytesIO(payload[4:-1])))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.broker.connections.remove(self)
+            self.writer.close()
+
+    def on_method(self, channel, class_id, method_id, decoder):
+        self.broker.methods.append((channel, class_id, method_id))
+        if class_id == amqp_constants.CLASS_CONNECTION:
+            if method_id == amqp_constants.CONNECTION_START_OK:
+                encoder = AmqpEncoder()
+                encoder.write_short(self.broker.channel_max)
+                encoder.write_long(self.broker.frame_max)
+                encoder.write_short(self.broker.heartbeat)
+                self.send_method(0, amqp_constants.CLASS_CONNECTION, amqp_constants.CONNECTION_TUNE, encoder)
+            elif method_id == amqp_constants.CONNECTION_OPEN:
+                self.virtualhost = decoder.read_shortstr()
+                encoder = AmqpEncoder()
+                encoder.write_shortstr('')
+                self.send_method(0, amqp_constants.CLASS_CONNECTION, amqp_constants.CONNECTION_OPEN_OK, encoder)
+            elif method_id == amqp_constants.CONNECTION_CLOSE:
+                self.send_method(0, amqp_constants.CLASS_CONNECTION, amqp_constants.CONNECTION_CLOSE_OK)
+                self.writer.close()
+        elif class_id == amqp_constants.CLASS_CHANNEL:
+            if method_id == amqp_constants.CHANNEL_OPEN:
+                encoder = AmqpEncoder()
+                encoder.write_long(0)
+                self.send_method(channel, amqp_constants.CLASS_CHANNEL, amqp_constants.CHANNEL_OPEN_OK, encoder)
+            elif method_id == amqp_constants.CHANNEL_CLOSE:
+                self.send_method(channel, amqp_constants.CLASS_CHANNEL, amqp_constants.CHANNEL_CLOSE_OK)
+        elif (class_id, method_id) == (amqp_constants.CLASS_BASIC, amqp_constants.BASIC_CONSUME):
+            decoder.read_short()
+            decoder.read_shortstr()
+            consumer_tag = decoder.read_shortstr()
+            if not decoder.read_octet() & 0b1000:
+                encoder = AmqpEncoder()
+                encoder.write_shortstr(consumer_tag)
+                self.send_method(channel, amqp_constants.CLASS_BASIC, amqp_constants.BASIC_CONSUME_OK, encoder)
+
+
+class FakeBroker:
+    """Accepts AMQP connections on a TCP port or on a unix socket"""
+
+    def __init__(self, loop, frame_max=131072, heartbeat=0, channel_max=2047, capabilities=None):
+        self.loop = loop
+        self.frame_max = frame_max
+        self.heartbeat = heartbeat
+        self.channel_max = channel_max
+        self.capabilities = capabilities or {}
+        self.connections = []
+        # (frame type, channel, payload) of every frame received
+        self.frames = []
+        # (channel, class id, method id) of every method received
+        self.methods = []
+        self.server = None
+        self.port = None
+
+    def _accept(self, reader, writer):
+        connection = FakeConnection(self, reader, writer)
+        self.connections.append(connection)
+        return connection.run()
+
+    @asyncio.coroutine
+    def start(self, host='127.0.0.1', port=0):
+        self.server = yield from asyncio.start_server(self._accept, host, port, loop=self.loop)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    @asyncio.coroutine
+    def start_unix(self, path):
+        self.server = yield from asyncio.start_unix_server(self._accept, path, loop=self.loop)
+
+    @asyncio.coroutine
+    def close(self):
+        self.server.close()
+        for connection in list(self.connections):
+            connection.writer.close()
+        yield from self.server.wait_closed()
@@ -114,6 +114,47 @@ class BasicGetTestCase(testcase.RabbitTestCase, unittest.TestCase):
         with self.assertRaises(exceptions.EmptyQueue):
             yield from self.channel.basic_get(queue_name)
 
+    @testing.coroutine
+    def test_basic_get_many(self):
+        queue_name = 'queue_name'
+        exchange_name = 'exchange_name'
+        yield from self.channel.queue_declare(queue_name)
+        yield from self.channel.exchange_declare(exchange_name, type_name='direct')
+        yield from self.channel.queue_bind(queue_name, exchange_name, routing_key='')
+        for i in range(10):
+            yield from self.channel.publish("payload %d" % i, exchange_name, routing_key='')
+
+        results = yield from self.channel.basic_get_many(queue_name, max_messages=20, window=4)
+        self.assertEqual(
+            [result['message'] for result in results], [('payload %d' % i).encode() for i in range(10)])
+
+        yield from self.channel.basic_client_ack(results[-1]['delivery_tag'], multiple=True)
+        results = yield from self.channel.basic_get_many(queue_name)
+        self.assertEqual(results, [])
+
+    @testing.coroutine
+    def test_basic_get_many_max_messages(self):
+        queue_name = 'queue_name'
+        exchange_name = 'exchange_name'
+        yield from self.channel.queue_declare(queue_name)
+        yield from self.channel.exchange_declare(exchange_name, type_name='direct')
+        yield from self.channel.queue_bind(queue_name, exchange_name, routing_key='')
+        for i in range(5):
+            yield from self.channel.publish("payload %d" % i, exchange_name, routing_key='')
+
+        results = yield from self.channel.basic_get_many(queue_name, max_messages=3, no_ack=True)
+        self.assertEqual(len(results), 3)
+        result = yield from self.channel.basic_get(queue_name, no_ack=True)
+        self.assertEqual(result['message'], b'payload 3')
+
+    @testing.coroutine
+    def test_basic_get_many_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            yield from self.channel.basic_get_many('queue_name', window=0)
+        with self.assertRaises(ValueError):
+            yield from self.channel.basic_get_many('queue_name', max_messages=-1)
+        self.assertEqual((yield from self.channel.basic_get_many('queue_name', max_messages=0)), [])
+
 
 class BasicDeliveryTestCase(testcase.RabbitTestCase, unittest.TestCase):
 
@@ -0,0 +1,76 @@
+"""
+    Tests the connection.blocked and connection.unblocked notifications
+"""
+
+import asyncio
+import unittest
+
+from . import testing
+from .fakebroker import FakeBroker
+from .. import connect as amqp_connect
+from .. import constants as amqp_constants
+from .. import exceptions
+from ..compat import ensure_future
+from ..frame import AmqpEncoder
+
+
+class ConnectionBlockedTestCase(testing.AsyncioTestCaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.broker = FakeBroker(self.loop)
+        self.loop.run_until_complete(self.broker.start())
+        self.transport, self.protocol = self.loop.run_until_complete(amqp_connect(
+            port=self.broker.port, blocked_timeout=0.2, loop=self.loop))
+        self.channel = self.loop.run_until_complete(self.protocol.channel())
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.protocol.close())
+        self.transport.close()
+        self.loop.run_until_complete(self.broker.close())
+        super().tearDown()
+
+    @asyncio.coroutine
+    def set_blocked(self, blocked):
+        connection = self.broker.connections[0]
+        if blocked:
+            encoder = AmqpEncoder()
+            encoder.write_shortstr('low on memory')
+            connection.send_method(0, amqp_constants.CLASS_CONNECTION, amqp_constants.CONNECTION_BLOCKED, encoder)
+        else:
+            connection.send_method(0, amqp_constants.CLASS_CONNECTION, amqp_constants.CONNECTION_UNBLOCKED)
+        while self.protocol.is_blocked != blocked:
+            yield from asyncio.sleep(0.01, loop=self.loop)
+
+    @testing.coroutine
+    def test_blocked_capability(self):
+        start_ok = [payload for _type, _channel, payload in self.broker.frames][0]
+        self.assertIn(b'connection.blockedt\x01', start_ok)
+
+    @testing.coroutine
+    def test_publish_waits_while_blocked(self):
+        yield from self.set_blocked(True)
+        self.assertEqual(self.protocol.blocked_reason, 'low on memory')
+        publish = ensure_future(self.channel.publish(b'message', '', 'queue'), loop=self.loop)
+        yield from asyncio.sleep(0.05, loop=self.loop)
+        self.assertFalse(publish.done())
+
+        yield from self.set_blocked(False)
+        yield from publish
+        self.assertEqual(self.protocol.blocked_count, 1)
+        self.assertGreater(self.protocol.blocked_time, 0.05)
+
+    @testing.coroutine
+    def test_publish_timeout(self):
+        yield from self.set_blocked(True)
+        with self.assertRaises(exceptions.ConnectionBlocked):
+            yield from self.channel.publish(b'message', '', 'queue')
+        # nothing was written
+        self.assertNotIn((self.channel.channel_id, 60, 40), self.broker.methods)
+
+    @testing.coroutine
+    def test_fail_fast(self):
+        yield from self.set_blocked(True)
+        self.protocol.blocked_timeout = 0
+        with self.assertRaises(exceptions.ConnectionBlocked):
+            yield from self.channel.basic_publish(b'message', '', 'queue')
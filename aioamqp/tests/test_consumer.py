@@ -0,0 +1,70 @@
+"""
+    Tests the executor consumer
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from . import testcase
+from . import testing
+from ..consumer import ExecutorConsumer
+
+
+class ExecutorConsumerTestCase(testcase.RabbitTestCase, unittest.TestCase):
+
+    @asyncio.coroutine
+    def publish_messages(self, bodies):
+        yield from self.channel.queue_declare('q')
+        yield from self.channel.exchange_declare('e', 'direct')
+        yield from self.channel.queue_bind('q', 'e', routing_key='rk')
+        for body in bodies:
+            yield from self.channel.publish(body, 'e', 'rk')
+
+    @testing.coroutine
+    def test_handlers_run_in_executor(self):
+        yield from self.publish_messages([('message %d' % i).encode() for i in range(10)])
+        handled = []
+        threads = set()
+
+        def handler(body, envelope, properties):
+            # a blocking call, it mustn't block the loop
+            time.sleep(0.05)
+            threads.add(threading.get_ident())
+            handled.append(body)
+
+        channel = yield from self.create_channel()
+        consumer = ExecutorConsumer(channel, handler, executor=ThreadPoolExecutor(4), prefetch_count=4)
+        yield from consumer.start('q')
+        for _ in range(50):
+            yield from asyncio.sleep(0.1, loop=self.loop)
+            if len(handled) == 10:
+                break
+        yield from consumer.stop()
+
+        self.assertEqual(sorted(handled), sorted(('message %d' % i).encode() for i in range(10)))
+        self.assertNotIn(threading.get_ident(), threads)
+        queues = self.list_queues()
+        self.assertEqual(queues['q']['messages'], 0)
+
+    @testing.coroutine
+    def test_failed_handler_requeued(self):
+        yield from self.publish_messages([b'boom'])
+        calls = []
+
+        def handler(body, envelope, properties):
+            calls.append(envelope.is_redeliver)
+            if not envelope.is_redeliver:
+                raise ValueError(body)
+
+        channel = yield from self.create_channel()
+        consumer = ExecutorConsumer(channel, handler, prefetch_count=1, requeue_on_error=True)
+        yield from consumer.start('q')
+        for _ in range(50):
+            yield from asyncio.sleep(0.1, loop=self.loop)
+            if len(calls) == 2:
+                break
+        yield from consumer.stop()
+        self.assertEqual(calls, [False, True])
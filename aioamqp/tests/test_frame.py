@@ -2,14 +2,24 @@
     Test frame format.
 """
 
+import datetime
 import io
+import pickle
+import struct
+import threading
 import unittest
 import sys
+from decimal import Decimal
+from unittest import mock
 
 from .. import constants as amqp_constants
 from .. import frame as frame_module
 from ..frame import AmqpEncoder
 from ..frame import AmqpResponse
+from ..frame import EncodedProperties
+from ..frame import LazyProperties
+from ..frame import LazyTable
+from ..properties import Properties
 
 
 class EncoderTestCase(unittest.TestCase):
@@ -38,6 +48,56 @@ class EncoderTestCase(unittest.TestCase):
             (b'F\x00\x00\x00\x18\x03barS\x00\x00\x00\x03baz\x03fooS\x00\x00\x00\x03bar',
              b'F\x00\x00\x00\x18\x03fooS\x00\x00\x00\x03bar\x03barS\x00\x00\x00\x03baz'))
 
+    def test_write_int(self):
+        for value, expected in (
+                (1, b'b\x01'),
+                (-128, b'b\x80'),
+                (1000, b'I\x00\x00\x03\xe8'),
+                (-2 ** 31, b'I\x80\x00\x00\x00'),
+                (2 ** 31, b'l\x00\x00\x00\x00\x80\x00\x00\x00'),
+        ):
+            encoder = AmqpEncoder()
+            encoder.write_value(value)
+            self.assertEqual(encoder.payload.getvalue(), expected)
+        with self.assertRaises(ValueError):
+            self.encoder.write_value(2 ** 63)
+
+    def test_write_unsupported(self):
+        with self.assertRaises(TypeError):
+            self.encoder.write_value(object())
+
+    def test_table_round_trip(self):
+        table = {
+            'str': 'héllo',
+            'bool': False,
+            'small': -3,
+            'int': 70000,
+            'long': -2 ** 40,
+            'float': 0.1,
+            'decimal': Decimal('-12.345'),
+            'timestamp': datetime.datetime(2017, 7, 14, 2, 40),
+            'none': None,
+            'array': [1, 'two', [3.0], {'four': 4}],
+            'tuple': (5, 6),
+            'bytes': bytearray(b'\x00\xff'),
+            'table': {'nested': True},
+        }
+        self.encoder.write_table(table)
+        data = self.encoder.payload.getvalue()
+        expected = dict(table, timestamp=1500000000, tuple=[5, 6])
+        decoded = frame_module.AmqpDecoder(io.BytesIO(data)).read_table()
+        self.assertEqual(decoded, expected)
+        self.assertIsInstance(decoded['bytes'], bytearray)
+        self.assertEqual(LazyTable(data[4:]).to_dict(), expected)
+
+    def test_write_negative_zero(self):
+        self.encoder.write_value(-0.0)
+        self.assertEqual(self.encoder.payload.getvalue(), b'd\x80\x00\x00\x00\x00\x00\x00\x00')
+
+    def test_write_shortstr_non_ascii(self):
+        self.encoder.write_shortstr('é')
+        self.assertEqual(self.encoder.payload.getvalue(), b'\x02\xc3\xa9')
+
     def test_write_message_properties_dont_crash(self):
         properties = {
             'content_type': 'plain/text',
@@ -101,3 +161,199 @@ class AmqpResponseTestCase(unittest.TestCase):
         finally:
             frame_module.DUMP_FRAMES = False
             sys.stdout = saved_stout
+
+
+class LazyPropertiesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        encoder = AmqpEncoder()
+        encoder.write_message_properties({
+            'content_type': 'application/json',
+            'headers': {'x-retries': 2},
+            'delivery_mode': 2,
+            'correlation_id': 'abc',
+            'timestamp': 1500000000,
+            'app_id': 'tests',
+        })
+        data = encoder.payload.getvalue()
+        flags = struct.unpack('!H', data[:2])[0]
+        self.properties = LazyProperties(memoryview(data)[2:], flags)
+
+    def test_decoded_on_access(self):
+        with mock.patch.object(frame_module.AmqpDecoder, 'read_table', side_effect=AssertionError):
+            self.assertEqual(self.properties.app_id, 'tests')
+            self.assertEqual(self.properties.correlation_id, 'abc')
+            self.assertEqual(self.properties.timestamp, 1500000000)
+            self.assertEqual(self.properties.delivery_mode, 2)
+        self.assertEqual(self.properties.headers, {'x-retries': 2})
+        self.assertEqual(self.properties.content_type, 'application/json')
+        self.assertIsNone(self.properties.reply_to)
+        with self.assertRaises(AttributeError):
+            self.properties.invalid  # pylint: disable=pointless-statement
+
+    def test_set(self):
+        self.properties.app_id = 'other'
+        self.assertEqual(self.properties.app_id, 'other')
+
+    def test_pickle(self):
+        properties = pickle.loads(pickle.dumps(self.properties))
+        self.assertIs(type(properties), Properties)
+        self.assertEqual(properties.headers, {'x-retries': 2})
+        self.assertEqual(properties.correlation_id, 'abc')
+        self.assertIsNone(properties.message_id)
+
+
+class LazyTableTestCase(unittest.TestCase):
+
+    def setUp(self):
+        encoder = AmqpEncoder()
+        encoder.write_table({
+            'x-retries': 2,
+            'x-death': {'reason': 'expired', 'count': 1},
+            'queue': 'events',
+            'enabled': True,
+        })
+        # without the table length
+        self.table = LazyTable(encoder.payload.getvalue()[4:])
+
+    def test_decoded_on_lookup(self):
+        with mock.patch.object(frame_module.AmqpDecoder, 'read_longstr', side_effect=AssertionError):
+            self.assertEqual(len(self.table), 4)
+            self.assertEqual(set(self.table), {'x-retries', 'x-death', 'queue', 'enabled'})
+            self.assertEqual(self.table['x-retries'], 2)
+            self.assertIs(self.table.get('enabled'), True)
+            self.assertIsNone(self.table.get('missing'))
+        self.assertEqual(self.table['queue'], 'events')
+        with self.assertRaises(KeyError):
+            self.table['missing']  # pylint: disable=pointless-statement
+
+    def test_nested_table(self):
+        self.assertIsInstance(self.table['x-death'], LazyTable)
+        self.assertEqual(self.table['x-death']['reason'], 'expired')
+
+    def test_to_dict(self):
+        expected = {
+            'x-retries': 2,
+            'x-death': {'reason': 'expired', 'count': 1},
+            'queue': 'events',
+            'enabled': True,
+        }
+        self.assertEqual(self.table.to_dict(), expected)
+        self.assertIs(type(self.table.to_dict()['x-death']), dict)
+        self.assertEqual(self.table, expected)
+
+    def test_encode(self):
+        encoder = AmqpEncoder()
+        encoder.write_table(self.table)
+        self.assertEqual(LazyTable(encoder.payload.getvalue()[4:]).to_dict(), self.table.to_dict())
+
+    def test_encoded_as_received(self):
+        encoder = AmqpEncoder()
+        with mock.patch.object(frame_module, '_pack_value', side_effect=AssertionError):
+            encoder.write_message_properties({'headers': self.table})
+        # the property flags and the table length
+        self.assertEqual(LazyTable(encoder.payload.getvalue()[6:]).to_dict(), self.table.to_dict())
+
+    def test_pickle(self):
+        table = pickle.loads(pickle.dumps(self.table))
+        self.assertIs(type(table), dict)
+        self.assertEqual(table, self.table.to_dict())
+
+
+class ShortstrCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = frame_module.ShortstrCache(maxsize=2)
+
+    def test_shared(self):
+        routing_key = self.cache.decode(b'routing.key')
+        self.assertEqual(routing_key, 'routing.key')
+        self.assertIs(self.cache.decode(bytes(bytearray(b'routing.key'))), routing_key)
+
+    def test_least_recently_used_dropped(self):
+        first = self.cache.decode(b'first')
+        second = self.cache.decode(b'second')
+        self.assertIs(self.cache.decode(b'first'), first)
+        self.cache.decode(b'third')
+        self.assertIs(self.cache.decode(b'first'), first)
+        self.assertIsNot(self.cache.decode(b'second'), second)
+
+    def test_threads(self):
+        strings = [('key %d' % i).encode() for i in range(3)]
+        errors = []
+        barrier = threading.Barrier(4)
+
+        def decode():
+            barrier.wait()
+            try:
+                # hits and evictions, interleaved
+                for index in range(100000):
+                    self.cache.decode(strings[index % 5 % 3])
+            except Exception as exc:  # pylint: disable=broad-except
+                errors.append(exc)
+
+        threads = [threading.Thread(target=decode) for _ in range(4)]
+        # switch threads as often as possible
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.cache._strings), 2)
+
+    def test_decoder(self):
+        encoder = AmqpEncoder()
+        encoder.write_shortstr('amq.ctag-1')
+        encoder.write_shortstr('amq.ctag-1')
+        decoder = frame_module.AmqpDecoder(io.BytesIO(encoder.payload.getvalue()))
+        self.assertIs(decoder.read_interned_shortstr(), decoder.read_interned_shortstr())
+
+    def test_properties_not_cached(self):
+        encoder = AmqpEncoder()
+        encoder.write_message_properties({'correlation_id': 'unique-id'})
+        data = encoder.payload.getvalue()
+        properties = LazyProperties(memoryview(data)[2:], struct.unpack('!H', data[:2])[0])
+        with mock.patch.object(frame_module.shortstr_cache, 'decode', side_effect=AssertionError):
+            self.assertEqual(properties.correlation_id, 'unique-id')
+
+
+class EncodedPropertiesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.properties = {
+            'content_type': 'application/json',
+            'headers': {'x-source': 'tests', 'x-version': 2},
+            'delivery_mode': 2,
+            'app_id': 'tests',
+        }
+
+    def encode(self, properties):
+        encoder = AmqpEncoder()
+        encoder.write_message_properties(properties)
+        return encoder.payload.getvalue()
+
+    def test_written_as_is(self):
+        encoded = EncodedProperties(self.properties)
+        self.assertEqual(encoded.app_id, 'tests')
+        self.assertEqual(self.encode(encoded), self.encode(self.properties))
+        self.assertEqual(EncodedProperties(delivery_mode=2).encoded, self.encode({'delivery_mode': 2}))
+
+    def test_read_only(self):
+        encoded = EncodedProperties(self.properties)
+        with self.assertRaises(AttributeError):
+            encoded.app_id = 'other'
+
+    def test_invalid_property(self):
+        with self.assertRaises(ValueError):
+            EncodedProperties(invalid='coucou')
+
+    def test_pickle(self):
+        encoded = pickle.loads(pickle.dumps(EncodedProperties(self.properties)))
+        self.assertEqual(encoded.to_dict(), self.properties)
+        self.assertEqual(encoded.encoded, self.encode(self.properties))
+
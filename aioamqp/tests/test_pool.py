@@ -0,0 +1,180 @@
+"""
+    Tests the channel and connection pools
+"""
+
+import asyncio
+import unittest
+from unittest import mock
+
+from . import testcase
+from . import testing
+from .. import exceptions
+from ..compat import ensure_future
+from ..pool import ChannelPool, ConnectionPool
+
+
+class ChannelPoolTestCase(testcase.RabbitTestCase, unittest.TestCase):
+
+    @testing.coroutine
+    def test_publish_spread_over_channels(self):
+        yield from self.channel.queue_declare('q')
+        yield from self.channel.exchange_declare('e', 'direct')
+        yield from self.channel.queue_bind('q', 'e', routing_key='rk')
+        pool = yield from self.amqp.channel_pool(size=4, publisher_confirms=True)
+        self.assertEqual(len(set(channel.channel_id for channel in pool.channels)), 4)
+
+        yield from asyncio.gather(
+            *[pool.publish(('message %d' % i).encode(), 'e', 'rk') for i in range(100)],
+            loop=self.loop)
+        queues = self.list_queues()
+        self.assertEqual(queues['q']['messages'], 100)
+        yield from pool.close()
+
+    @testing.coroutine
+    def test_acquire_release(self):
+        pool = yield from self.amqp.channel_pool(size=2)
+        first = yield from pool.acquire()
+        second = yield from pool.acquire()
+        self.assertIsNot(first, second)
+
+        waiter = ensure_future(pool.acquire(), loop=self.loop)
+        yield from asyncio.sleep(0.1, loop=self.loop)
+        self.assertFalse(waiter.done())
+        pool.release(first)
+        third = yield from waiter
+        self.assertIs(third, first)
+        pool.release(second)
+        pool.release(third)
+        yield from pool.close()
+
+    @testing.coroutine
+    def test_closed_channel_replaced(self):
+        pool = yield from self.amqp.channel_pool(size=1)
+        channel = yield from pool.acquire()
+        with self.assertRaises(exceptions.ChannelClosed):
+            yield from channel.queue_declare('q', passive=True)
+        pool.release(channel)
+
+        replacement = yield from pool.acquire()
+        self.assertIsNot(replacement, channel)
+        self.assertTrue(replacement.is_open)
+        pool.release(replacement)
+        yield from pool.close()
+
+
+class ChannelPoolLeaseTestCase(testing.AsyncioTestCaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.published = []
+        channels = []
+
+        @asyncio.coroutine
+        def open_channel():
+            channel = mock.Mock(is_open=True, channel_id=len(channels) + 1)
+
+            @asyncio.coroutine
+            def publish(payload, exchange_name, routing_key, **kwargs):
+                self.published.append(channel)
+
+            channel.publish = publish
+            channels.append(channel)
+            return channel
+
+        self.pool = ChannelPool(mock.Mock(_loop=self.loop, channel=open_channel), size=3)
+
+    @testing.coroutine
+    def test_leased_channels_not_published_on(self):
+        yield from self.pool.open()
+        leased = []
+        for _ in range(2):
+            leased.append((yield from self.pool.acquire()))
+        free_channel, = set(self.pool.channels) - set(leased)
+        yield from asyncio.gather(
+            *[self.pool.publish(b'payload', 'e', 'rk') for _ in range(10)], loop=self.loop)
+        self.assertEqual(self.published, [free_channel] * 10)
+
+    @testing.coroutine
+    def test_publish_waits_for_a_release(self):
+        yield from self.pool.open()
+        leased = []
+        for _ in range(3):
+            leased.append((yield from self.pool.acquire()))
+        publish = ensure_future(self.pool.publish(b'payload', 'e', 'rk'), loop=self.loop)
+        yield from asyncio.sleep(0.01, loop=self.loop)
+        self.assertFalse(publish.done())
+        self.pool.release(leased[1])
+        yield from publish
+        self.assertEqual(self.published, [leased[1]])
+        # the slot is free again
+        self.assertIs((yield from self.pool.acquire()), leased[1])
+
+
+class ConnectionPoolTestCase(testcase.RabbitTestCase, unittest.TestCase):
+
+    @asyncio.coroutine
+    def create_pool(self, **kwargs):
+        pool = ConnectionPool(
+            [(self.host, self.port)], virtualhost=self.vhost, loop=self.loop, **kwargs)
+        yield from pool.open()
+        return pool
+
+    @testing.coroutine
+    def test_publish_spread_over_connections(self):
+        yield from self.channel.queue_declare('q')
+        pool = yield from self.create_pool(size=3, channels_per_connection=2, publisher_confirms=True)
+        self.assertEqual(len(pool.protocols), 3)
+
+        # the pool channels don't prefix the names, publish through the default exchange
+        yield from asyncio.gather(
+            *[pool.publish(('message %d' % i).encode(), '', self.full_name('q')) for i in range(90)],
+            loop=self.loop)
+        queues = self.list_queues()
+        self.assertEqual(queues['q']['messages'], 90)
+        yield from pool.close()
+
+    @testing.coroutine
+    def test_lost_connection_reconnected(self):
+        pool = yield from self.create_pool(size=2, reconnect_delay=0.1)
+        lost = pool.protocols[0]
+        lost._stream_reader._transport.close()
+        yield from lost.wait_closed()
+        self.assertEqual(len(pool.protocols), 1)
+
+        for _ in range(50):
+            yield from asyncio.sleep(0.1, loop=self.loop)
+            if len(pool.protocols) == 2:
+                break
+        self.assertEqual(len(pool.protocols), 2)
+        self.assertNotIn(lost, pool.protocols)
+        yield from pool.close()
+
+
+class ConnectionPoolWatchTestCase(testing.AsyncioTestCaseMixin, unittest.TestCase):
+
+    @testing.coroutine
+    def test_unexpected_error_retried(self):
+        pool = ConnectionPool(size=1, reconnect_delay=0.01, loop=self.loop)
+        connection_closed = asyncio.Event(loop=self.loop)
+        connection_closed.set()
+        pool._protocols[0] = mock.Mock(connection_closed=connection_closed)
+        attempts = []
+
+        @asyncio.coroutine
+        def connect(index):
+            attempts.append(index)
+            if len(attempts) == 1:
+                raise RuntimeError("unexpected")
+            pool._protocols[index] = mock.Mock(connection_closed=asyncio.Event(loop=self.loop))
+
+        pool._connect = connect
+        watcher = ensure_future(pool._watch(0), loop=self.loop)
+        with self.assertLogs('aioamqp.pool', level='ERROR'):
+            for _ in range(50):
+                yield from asyncio.sleep(0.01, loop=self.loop)
+                if len(attempts) == 2:
+                    break
+        self.assertEqual(attempts, [0, 0])
+        self.assertFalse(watcher.done())
+        watcher.cancel()
+        yield from asyncio.wait([watcher], loop=self.loop)
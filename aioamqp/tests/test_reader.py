@@ -0,0 +1,79 @@
+"""
+    Tests the frames reader
+"""
+
+import asyncio
+import struct
+import unittest
+from unittest import mock
+
+from . import testing
+from .. import constants as amqp_constants
+from ..reader import FrameReader
+
+
+def make_frame(frame_type, channel, payload):
+    return struct.pack('!BHI', frame_type, channel, len(payload)) + payload + amqp_constants.FRAME_END
+
+
+class FrameReaderTestCase(testing.AsyncioTestCaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.reader = FrameReader(buffer_size=32, loop=self.loop)
+
+    def receive(self, data):
+        """Receive the data like a transport of a BufferedProtocol"""
+        buffer = self.reader.get_buffer(-1)
+        buffer[:len(data)] = data
+        self.reader.buffer_updated(len(data))
+
+    @testing.coroutine
+    def test_read_frames(self):
+        self.receive(make_frame(1, 1, b'method') + make_frame(8, 0, b''))
+        self.assertEqual((yield from self.reader.read_frame()), (1, 1, b'method'))
+        self.assertEqual((yield from self.reader.read_frame()), (8, 0, b''))
+
+    @testing.coroutine
+    def test_frame_split(self):
+        data = make_frame(3, 2, b'body' * 100) + make_frame(1, 1, b'method')
+        read = asyncio.Task(self.reader.read_frame(), loop=self.loop)
+        for i in range(0, len(data), 7):
+            self.reader.feed_data(data[i:i + 7])
+            yield from asyncio.sleep(0, loop=self.loop)
+        # the buffer grew to hold the frame
+        self.assertEqual((yield from read), (3, 2, b'body' * 100))
+        self.assertEqual((yield from self.reader.read_frame()), (1, 1, b'method'))
+
+    @testing.coroutine
+    def test_buffer_reused(self):
+        frames = [make_frame(1, 1, ('method %d' % i).encode()) for i in range(1000)]
+        data = b''.join(frames)
+        # a frame and a half at a time: the unread data is moved to the beginning of the buffer
+        chunk_size = len(frames[0]) * 3 // 2
+        for i in range(0, len(data), chunk_size):
+            self.receive(data[i:i + chunk_size])
+            while frames and self.reader._end - self.reader._start >= len(frames[0]):
+                self.assertEqual((yield from self.reader.read_frame()), (1, 1, frames.pop(0)[7:-1]))
+        self.assertEqual(frames, [])
+        self.assertLessEqual(len(self.reader._recv_buffer), 2 * 16 * 1024)
+
+    @testing.coroutine
+    def test_eof(self):
+        self.receive(make_frame(1, 1, b'method')[:9])
+        self.reader.feed_eof()
+        with self.assertRaises(asyncio.IncompleteReadError):
+            yield from self.reader.read_frame()
+
+    @testing.coroutine
+    def test_transport_paused(self):
+        transport = mock.Mock()
+        self.reader.set_transport(transport)
+        frame = make_frame(3, 1, b'x' * 1000)
+        for _ in range(200):
+            self.reader.feed_data(frame)
+        transport.pause_reading.assert_called_once_with()
+
+        for _ in range(200):
+            yield from self.reader.read_frame()
+        transport.resume_reading.assert_called_once_with()
@@ -0,0 +1,105 @@
+"""
+    Tests the robust connection
+"""
+
+import asyncio
+import unittest
+from unittest import mock
+
+from . import testcase
+from . import testing
+from ..compat import ensure_future
+from ..robust import RobustConnection
+
+
+class RobustConnectionTestCase(testcase.RabbitTestCase, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.robust = RobustConnection(
+            self.host, self.port, reconnect_delay=0.1, virtualhost=self.vhost, loop=self.loop)
+        self.loop.run_until_complete(self.robust.connect())
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.robust.close())
+        super().tearDown()
+
+    @asyncio.coroutine
+    def lose_connection(self):
+        protocol = self.robust.protocol
+        protocol._stream_reader._transport.close()
+        yield from protocol.wait_closed()
+        yield from asyncio.wait_for(self.robust.connected.wait(), timeout=10, loop=self.loop)
+
+    @testing.coroutine
+    def test_consumer_recovered(self):
+        channel = yield from self.robust.channel()
+        yield from channel.exchange_declare('robust_exchange', 'direct')
+        yield from channel.queue_declare('robust_queue', auto_delete=True)
+        yield from channel.queue_bind('robust_queue', 'robust_exchange', routing_key='rk')
+        yield from channel.basic_qos(prefetch_count=5)
+        received = asyncio.Queue(loop=self.loop)
+
+        @asyncio.coroutine
+        def callback(callback_channel, body, envelope, properties):
+            self.assertIs(callback_channel, channel)
+            yield from callback_channel.basic_client_ack(envelope.delivery_tag)
+            yield from received.put(body)
+
+        yield from channel.basic_consume(callback, queue_name='robust_queue')
+        yield from channel.publish(b'before', 'robust_exchange', 'rk')
+        self.assertEqual((yield from received.get()), b'before')
+
+        yield from self.lose_connection()
+        self.assertEqual(self.robust.reconnects, 1)
+        # the auto-deleted queue and its binding are declared again
+        yield from channel.publish(b'after', 'robust_exchange', 'rk')
+        self.assertEqual((yield from received.get()), b'after')
+
+    @testing.coroutine
+    def test_server_named_queue_renamed(self):
+        channel = yield from self.robust.channel()
+        yield from channel.exchange_declare('robust_exchange', 'fanout')
+        result = yield from channel.queue_declare(exclusive=True)
+        yield from channel.queue_bind(result['queue'], 'robust_exchange', routing_key='')
+        received = asyncio.Queue(loop=self.loop)
+
+        @asyncio.coroutine
+        def callback(callback_channel, body, envelope, properties):
+            yield from received.put(envelope.routing_key)
+
+        yield from channel.basic_consume(callback, queue_name=result['queue'], no_ack=True)
+        yield from self.lose_connection()
+
+        yield from channel.publish(b'after', 'robust_exchange', 'rk')
+        self.assertEqual((yield from received.get()), 'rk')
+
+
+class RobustConnectionWatchTestCase(testing.AsyncioTestCaseMixin, unittest.TestCase):
+
+    @testing.coroutine
+    def test_unexpected_error_retried(self):
+        robust = RobustConnection(reconnect_delay=0.01, loop=self.loop)
+        connection_closed = asyncio.Event(loop=self.loop)
+        connection_closed.set()
+        robust.protocol = mock.Mock(connection_closed=connection_closed)
+        robust.transport = mock.Mock()
+        attempts = []
+
+        @asyncio.coroutine
+        def connect():
+            attempts.append(len(attempts))
+            if len(attempts) == 1:
+                raise asyncio.TimeoutError()
+            robust.protocol = mock.Mock(connection_closed=asyncio.Event(loop=self.loop))
+
+        robust._connect = connect
+        watcher = ensure_future(robust._watch(), loop=self.loop)
+        with self.assertLogs('aioamqp.robust', level='ERROR'):
+            yield from asyncio.wait_for(robust.connected.wait(), timeout=1, loop=self.loop)
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(robust.reconnects, 1)
+        self.assertTrue(robust.transport.close.called)
+        self.assertFalse(watcher.done())
+        watcher.cancel()
+        yield from asyncio.wait([watcher], loop=self.loop)
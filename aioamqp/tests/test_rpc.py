@@ -0,0 +1,226 @@
+"""
+    Tests the RPC helpers
+"""
+
+import asyncio
+import struct
+import unittest
+from unittest import mock
+
+from . import testcase
+from . import testing
+from .. import connect as aioamqp_connect
+from .. import exceptions
+from ..channel import Channel
+from ..frame import AmqpEncoder, EncodedProperties, LazyProperties
+from ..rpc import RpcClient, RpcServer
+
+
+class RpcTestCase(testcase.RabbitTestCase):
+
+    @asyncio.coroutine
+    def create_plain_channel(self):
+        """A channel which doesn't prefix the names with the test name
+
+        The RPC helpers consume the amq.rabbitmq.reply-to pseudo queue and reply
+        through the default exchange, the channels of the test case would prefix them.
+        """
+        _transport, protocol = yield from aioamqp_connect(
+            host=self.host, port=self.port, virtualhost=self.vhost, loop=self.loop)
+        self.amqps.append(protocol)
+        return (yield from protocol.channel())
+
+
+class RpcClientTestCase(RpcTestCase, unittest.TestCase):
+
+    @asyncio.coroutine
+    def start_server(self, queue_name):
+        yield from self.channel.queue_declare(queue_name)
+        yield from self.channel.exchange_declare('rpc_exchange', 'direct')
+        yield from self.channel.queue_bind(queue_name, 'rpc_exchange', routing_key='rpc')
+
+        @asyncio.coroutine
+        def on_request(channel, body, envelope, properties):
+            if body == b'no reply':
+                return
+            # bypass the test name prefixing, replies go through the default exchange
+            yield from Channel.publish(
+                channel, body.upper(), '', properties.reply_to,
+                {'correlation_id': properties.correlation_id})
+
+        yield from self.channel.basic_consume(on_request, queue_name=queue_name, no_ack=True)
+
+    @testing.coroutine
+    def test_concurrent_calls(self):
+        yield from self.start_server('rpc_queue')
+        client_channel = yield from self.create_plain_channel()
+        client = RpcClient(client_channel, timeout=5)
+        yield from client.start()
+
+        replies = yield from asyncio.gather(
+            *[client.call(('call %d' % i).encode(), self.full_name('rpc_exchange'), 'rpc') for i in range(100)],
+            loop=self.loop)
+        self.assertEqual(replies, [('CALL %d' % i).encode() for i in range(100)])
+        self.assertEqual(client.pending_calls, 0)
+        yield from client.stop()
+
+    @testing.coroutine
+    def test_call_timeout(self):
+        yield from self.start_server('rpc_queue')
+        client_channel = yield from self.create_plain_channel()
+        client = RpcClient(client_channel)
+        yield from client.start()
+
+        with self.assertRaises(asyncio.TimeoutError):
+            yield from client.call(b'no reply', self.full_name('rpc_exchange'), 'rpc', timeout=0.2)
+        self.assertEqual(client.pending_calls, 0)
+        yield from client.stop()
+
+
+class RpcServerTestCase(RpcTestCase, unittest.TestCase):
+
+    @asyncio.coroutine
+    def start_server(self, handler, concurrency, timeout=None):
+        yield from self.channel.queue_declare('rpc_queue')
+        yield from self.channel.exchange_declare('rpc_exchange', 'direct')
+        yield from self.channel.queue_bind('rpc_queue', 'rpc_exchange', routing_key='rpc')
+        channel = yield from self.create_plain_channel()
+        server = RpcServer(channel, handler, concurrency=concurrency, timeout=timeout)
+        yield from server.start(self.full_name('rpc_queue'))
+        return server
+
+    @testing.coroutine
+    def test_concurrent_requests(self):
+        running = []
+
+        @asyncio.coroutine
+        def handler(body, envelope, properties):
+            running.append(body)
+            self.assertLessEqual(len(running), 10)
+            yield from asyncio.sleep(0.01, loop=self.loop)
+            running.remove(body)
+            return body.upper()
+
+        server = yield from self.start_server(handler, concurrency=10)
+        client = RpcClient((yield from self.create_plain_channel()), timeout=5)
+        yield from client.start()
+
+        replies = yield from asyncio.gather(
+            *[client.call(('call %d' % i).encode(), self.full_name('rpc_exchange'), 'rpc') for i in range(50)],
+            loop=self.loop)
+        self.assertEqual(replies, [('CALL %d' % i).encode() for i in range(50)])
+
+        yield from server.stop()
+        self.assertEqual(server.metrics.requests, 50)
+        self.assertEqual(server.metrics.in_flight, 0)
+        self.assertLessEqual(server.metrics.acks_sent, 50)
+        self.assertGreater(server.metrics.max_handling_time, 0)
+        queues = self.list_queues()
+        self.assertEqual(queues['rpc_queue']['messages'], 0)
+
+    @testing.coroutine
+    def test_handler_error(self):
+        @asyncio.coroutine
+        def handler(body, envelope, properties):
+            raise ValueError('invalid request')
+
+        server = yield from self.start_server(handler, concurrency=1)
+        client = RpcClient((yield from self.create_plain_channel()), timeout=5)
+        yield from client.start()
+
+        with self.assertRaises(exceptions.RpcError):
+            yield from client.call(b'request', self.full_name('rpc_exchange'), 'rpc')
+        yield from server.stop()
+        self.assertEqual(server.metrics.errors, 1)
+
+    @testing.coroutine
+    def test_handler_timeout(self):
+        @asyncio.coroutine
+        def handler(body, envelope, properties):
+            yield from asyncio.sleep(10, loop=self.loop)
+
+        server = yield from self.start_server(handler, concurrency=1, timeout=0.1)
+        client = RpcClient((yield from self.create_plain_channel()), timeout=5)
+        yield from client.start()
+
+        with self.assertRaises(exceptions.RpcError):
+            yield from client.call(b'request', self.full_name('rpc_exchange'), 'rpc')
+        yield from server.stop()
+        self.assertEqual(server.metrics.errors, 1)
+        self.assertLess(server.metrics.max_handling_time, 1)
+
+
+class RpcServerAcksTestCase(testing.AsyncioTestCaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.acks = []
+
+        @asyncio.coroutine
+        def basic_client_ack(delivery_tag, multiple=False):
+            self.acks.append((delivery_tag, multiple))
+
+        channel = mock.Mock(_loop=self.loop, basic_client_ack=basic_client_ack)
+        self.server = RpcServer(channel, None)
+
+    def deliver(self, *delivery_tags):
+        for delivery_tag in delivery_tags:
+            # the requests aren't handled, only registered
+            self.server._unacked[delivery_tag] = False
+            if delivery_tag == self.server._contiguous_tag + 1:
+                self.server._contiguous_tag = delivery_tag
+
+    @testing.coroutine
+    def test_multiple_ack(self):
+        self.deliver(1, 2, 3)
+        for delivery_tag in (1, 2, 3):
+            self.server._unacked[delivery_tag] = True
+        yield from self.server._flush_acks()
+        self.assertEqual(self.acks, [(3, True)])
+
+    @testing.coroutine
+    def test_channel_shared(self):
+        # the delivery tag 3 went to another consumer of the channel
+        self.deliver(1, 2, 4, 5)
+        for delivery_tag in (1, 2, 4, 5):
+            self.server._unacked[delivery_tag] = True
+        yield from self.server._flush_acks()
+        self.assertEqual(self.acks, [(2, True), (4, False), (5, False)])
+
+
+class RpcClientPropertiesTestCase(testing.AsyncioTestCaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.published = []
+
+        @asyncio.coroutine
+        def publish(payload, exchange_name, routing_key, properties):
+            self.published.append(properties)
+            self.client._futures[properties['correlation_id']].set_result(b'reply')
+
+        self.client = RpcClient(mock.Mock(_loop=self.loop, publish=publish))
+        self.client.consumer_tag = 'ctag'
+
+    @testing.coroutine
+    def test_encoded_properties(self):
+        properties = EncodedProperties(content_type='application/json', headers={'x-source': 'billing'})
+        self.assertEqual((yield from self.client.call(b'request', '', 'rpc_queue', properties)), b'reply')
+        published, = self.published
+        self.assertEqual(published['content_type'], 'application/json')
+        self.assertEqual(published['headers'], {'x-source': 'billing'})
+        self.assertEqual(published['reply_to'], 'amq.rabbitmq.reply-to')
+        self.assertIn('correlation_id', published)
+        self.assertIsNone(properties.correlation_id)
+
+    @testing.coroutine
+    def test_received_properties(self):
+        encoder = AmqpEncoder()
+        encoder.write_message_properties({'headers': {'x-retries': 2}, 'correlation_id': 'abc'})
+        data = encoder.payload.getvalue()
+        properties = LazyProperties(memoryview(data)[2:], struct.unpack('!H', data[:2])[0])
+        yield from self.client.call(b'request', '', 'rpc_queue', properties)
+        published, = self.published
+        self.assertEqual(set(published), {'headers', 'correlation_id', 'reply_to'})
+        self.assertEqual(published['headers'], {'x-retries': 2})
+        self.assertNotEqual(published['correlation_id'], 'abc')
@@ -0,0 +1,165 @@
+"""
+    Tests the outbound frames scheduler
+"""
+
+import asyncio
+import unittest
+
+from . import testing
+from .fakebroker import FakeBroker
+from .. import connect as amqp_connect
+from .. import constants as amqp_constants
+from ..scheduler import FrameScheduler, is_content
+
+
+class FrameSchedulerTestCase(testing.AsyncioTestCaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.written = []
+        self.scheduler = FrameScheduler(self.written.append, self.written.extend, self.loop, coalescing=False)
+
+    def test_is_content(self):
+        self.assertTrue(is_content(amqp_constants.TYPE_BODY))
+        self.assertTrue(is_content(amqp_constants.TYPE_METHOD, amqp_constants.CLASS_BASIC,
+                                   amqp_constants.BASIC_PUBLISH))
+        self.assertFalse(is_content(amqp_constants.TYPE_METHOD, amqp_constants.CLASS_BASIC,
+                                    amqp_constants.BASIC_ACK))
+        self.assertFalse(is_content(amqp_constants.TYPE_HEARTBEAT))
+
+    def test_written_at_once(self):
+        self.scheduler.write_frame(1, b'a1', content=True)
+        self.assertEqual(self.written, [b'a1'])
+        self.assertIsNone(self.scheduler.wait_flushed())
+
+    def test_interleaved(self):
+        self.scheduler.pause()
+        for frame in (b'a1', b'a2', b'a3'):
+            self.scheduler.write_frame(1, frame, content=True)
+        for frame in (b'b1', b'b2'):
+            self.scheduler.write_frame(2, frame, content=True)
+        self.scheduler.write_frame(3, b'ack')
+        self.scheduler.write_frame(0, b'heartbeat')
+        self.assertEqual(self.scheduler.backlog, 22)
+        self.assertEqual(self.written, [])
+
+        self.scheduler.resume()
+        self.assertEqual(self.written, [b'heartbeat', b'ack', b'a1', b'b1', b'a2', b'b2', b'a3'])
+        self.assertEqual(self.scheduler.backlog, 0)
+
+    def test_channel_order_kept(self):
+        self.scheduler.pause()
+        self.scheduler.write_frame(1, b'publish', content=True)
+        self.scheduler.write_frame(1, b'body', content=True)
+        self.scheduler.write_frame(1, b'close')
+        self.scheduler.write_frame(2, b'ack')
+        self.scheduler.resume()
+        self.assertEqual(self.written, [b'ack', b'publish', b'body', b'close'])
+
+    def test_paused_again(self):
+        def write(frame):
+            self.written.append(frame)
+            self.scheduler.pause()
+        self.scheduler._write = write
+        self.scheduler.pause()
+        self.scheduler.write_frame(1, b'a1', content=True)
+        self.scheduler.write_frame(1, b'a2', content=True)
+        self.scheduler.resume()
+        self.assertEqual(self.written, [b'a1'])
+        self.scheduler.resume()
+        self.assertEqual(self.written, [b'a1', b'a2'])
+
+    @testing.coroutine
+    def test_wait_flushed(self):
+        self.scheduler.pause()
+        self.scheduler.write_frame(1, b'a1', content=True)
+        self.scheduler.write_frame(1, b'a2', content=True)
+        self.scheduler.write_frame(2, b'b1', content=True)
+        self.assertIsNone(self.scheduler.wait_flushed(3))
+        channel_2 = self.scheduler.wait_flushed(2)
+        flushed = self.scheduler.wait_flushed()
+
+        self.scheduler.resume()
+        yield from asyncio.wait_for(channel_2, 1, loop=self.loop)
+        yield from asyncio.wait_for(flushed, 1, loop=self.loop)
+
+
+class WriteCoalescingTestCase(testing.AsyncioTestCaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.writes = []
+        self.scheduler = FrameScheduler(
+            lambda frame: self.writes.append([frame]), self.writes.append, self.loop, coalescing_limit=10)
+
+    @testing.coroutine
+    def test_written_at_the_end_of_the_iteration(self):
+        self.scheduler.write_frame(1, b'ack1')
+        self.scheduler.write_frame(2, b'ack2')
+        self.assertEqual(self.writes, [])
+        yield from asyncio.sleep(0, loop=self.loop)
+        self.assertEqual(self.writes, [[b'ack1', b'ack2']])
+
+    def test_limit(self):
+        self.scheduler.write_frame(1, b'ack1')
+        self.scheduler.write_frame(1, b'publish', content=True)
+        self.assertEqual(self.writes, [[b'ack1', b'publish']])
+
+    @testing.coroutine
+    def test_uncorked_before_queued_frames(self):
+        self.scheduler.write_frame(1, b'ack1')
+        self.scheduler.uncork()
+        self.scheduler.pause()
+        self.scheduler.write_frame(1, b'ack2')
+        self.scheduler.resume()
+        yield from asyncio.sleep(0, loop=self.loop)
+        self.assertEqual(self.writes, [[b'ack1'], [b'ack2']])
+
+    @testing.coroutine
+    def test_clear(self):
+        self.scheduler.write_frame(1, b'ack1')
+        self.scheduler.clear()
+        yield from asyncio.sleep(0, loop=self.loop)
+        self.assertEqual(self.writes, [])
+
+
+class FairWritesTestCase(testing.AsyncioTestCaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.broker = FakeBroker(self.loop)
+        self.loop.run_until_complete(self.broker.start())
+        self.transport, self.protocol = self.loop.run_until_complete(amqp_connect(
+            port=self.broker.port, socket_options={'sndbuf': 4096}, write_buffer_limits=(4096, 1024),
+            loop=self.loop))
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.protocol.close())
+        self.transport.close()
+        self.loop.run_until_complete(self.broker.close())
+        super().tearDown()
+
+    @testing.coroutine
+    def test_small_message_not_held_back(self):
+        bulk = yield from self.protocol.channel()
+        small = yield from self.protocol.channel()
+        large_publish = asyncio.Task(bulk.publish(b'x' * (2 * 1024 * 1024), '', 'bulk'), loop=self.loop)
+        # the large message is being written
+        yield from asyncio.sleep(0, loop=self.loop)
+        yield from small.publish(b'small', '', 'small')
+        yield from large_publish
+        yield from self.protocol._drain()
+        while len([1 for frame_type, _channel, _payload in self.broker.frames
+                   if frame_type == amqp_constants.TYPE_BODY]) < 17:
+            yield from asyncio.sleep(0.01, loop=self.loop)
+
+        channels = [channel for _frame_type, channel, _payload in self.broker.frames]
+        last_small = len(channels) - 1 - channels[::-1].index(small.channel_id)
+        last_bulk = len(channels) - 1 - channels[::-1].index(bulk.channel_id)
+        # the small message went through between the body frames of the large one
+        self.assertLess(last_small, last_bulk - 10)
+
+    def test_drain_fast_path(self):
+        # the transport buffer is below its high water mark: drain() doesn't suspend
+        with self.assertRaises(StopIteration):
+            next(iter(self.protocol._drain()))
@@ -0,0 +1,65 @@
+"""
+    Tests the shared memory handoff of the message bodies
+"""
+
+import pickle
+import unittest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from ..shm import SharedBody, SharedMemoryPool, resource_tracker, shared_memory
+
+
+def _checksum(body):
+    with body.attach() as view:
+        return len(view), sum(view[:16])
+
+
+@unittest.skipIf(shared_memory is None, "shared memory needs python 3.8+")
+class SharedMemoryPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = SharedMemoryPool(min_size=1024, max_free=1)
+        self.addCleanup(self.pool.close)
+
+    def test_small_bodies_stay_bytes(self):
+        self.assertIsNone(self.pool.body_allocator(1023, None, None))
+
+    def test_body_read_by_another_process(self):
+        buffer, body = self.pool.body_allocator(3000, None, None)
+        buffer[:3000] = b'\x01' * 3000
+        body = pickle.loads(pickle.dumps(body))
+        with ProcessPoolExecutor(1) as executor:
+            self.assertEqual(executor.submit(_checksum, body).result(), (3000, 16))
+        # the segment outlives the worker process
+        self.assertEqual(body.read(), b'\x01' * 3000)
+
+    def test_segments_recycled(self):
+        _buffer, first = self.pool.body_allocator(3000, None, None)
+        _buffer, second = self.pool.body_allocator(4000, None, None)
+        self.assertEqual(self.pool.segments_used, 2)
+        self.pool.release(first)
+        self.pool.release(second)
+        self.assertEqual(self.pool.segments_used, 0)
+
+        # same size class, only max_free segments are kept
+        _buffer, third = self.pool.body_allocator(3500, None, None)
+        self.assertIn(third.name, (first.name, second.name))
+        self.assertIsInstance(third, SharedBody)
+
+    def test_attached_by_threads(self):
+        buffer, body = self.pool.body_allocator(3000, None, None)
+        buffer[:3000] = b'\x01' * 3000
+        register = resource_tracker.register
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(_checksum, [body] * 200))
+        self.assertEqual(results, [(3000, 16)] * 200)
+        # the registration isn't left disabled
+        self.assertIs(resource_tracker.register, register)
+
+
+@unittest.skipIf(shared_memory is not None, "shared memory is available")
+class SharedMemoryUnavailableTestCase(unittest.TestCase):
+
+    def test_pool_not_implemented(self):
+        with self.assertRaises(NotImplementedError):
+            SharedMemoryPool()
@@ -0,0 +1,117 @@
+"""
+    Tests the timer wheel
+"""
+
+import asyncio
+import time
+import unittest
+
+from . import testing
+from .fakebroker import FakeBroker
+from .. import connect as amqp_connect
+from .. import constants as amqp_constants
+from ..timer import TimerWheel
+
+
+class TimerWheelTestCase(testing.AsyncioTestCaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.wheel = TimerWheel(self.loop, resolution=0.01, slots=8)
+        self.fired = []
+
+    def callback(self, name):
+        self.fired.append((name, self.loop.time()))
+
+    @testing.coroutine
+    def test_call_later(self):
+        start = self.loop.time()
+        self.wheel.call_later(0.05, self.callback, 'a')
+        self.wheel.call_later(0.02, self.callback, 'b')
+        # longer than a revolution of the wheel
+        self.wheel.call_later(0.13, self.callback, 'c')
+        self.assertEqual(len(self.wheel), 3)
+        yield from asyncio.sleep(0.25, loop=self.loop)
+
+        self.assertEqual([name for name, _time in self.fired], ['b', 'a', 'c'])
+        for (name, fired_at), delay in zip(self.fired, (0.02, 0.05, 0.13)):
+            self.assertGreaterEqual(fired_at - start, delay)
+        self.assertEqual(len(self.wheel), 0)
+        # the wheel doesn't tick when it's empty
+        self.assertIsNone(self.wheel._tick_handle)
+
+    @testing.coroutine
+    def test_cancel(self):
+        handle = self.wheel.call_later(0.02, self.callback, 'a')
+        self.wheel.call_later(0.03, self.callback, 'b')
+        handle.cancel()
+        self.assertTrue(handle.cancelled())
+        self.assertEqual(len(self.wheel), 1)
+        yield from asyncio.sleep(0.06, loop=self.loop)
+        self.assertEqual([name for name, _time in self.fired], ['b'])
+        self.assertFalse(handle.fired())
+
+    @testing.coroutine
+    def test_busy_loop_catch_up(self):
+        self.wheel.call_later(0.01, self.callback, 'a')
+        self.wheel.call_later(0.04, self.callback, 'b')
+        # block the loop for several ticks
+        self.loop.call_soon(time.sleep, 0.06)
+        yield from asyncio.sleep(0.08, loop=self.loop)
+        self.assertEqual([name for name, _time in self.fired], ['a', 'b'])
+
+    def test_clear(self):
+        handle = self.wheel.call_later(0.02, self.callback, 'a')
+        self.wheel.clear()
+        self.assertEqual(len(self.wheel), 0)
+        self.assertTrue(handle.cancelled())
+        self.assertIsNone(self.wheel._tick_handle)
+
+
+class AckDeadlineTestCase(testing.AsyncioTestCaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.broker = FakeBroker(self.loop)
+        self.loop.run_until_complete(self.broker.start())
+        self.transport, self.protocol = self.loop.run_until_complete(amqp_connect(
+            port=self.broker.port, loop=self.loop))
+        self.channel = self.loop.run_until_complete(self.protocol.channel())
+        self.deliveries = []
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.protocol.close())
+        self.transport.close()
+        self.loop.run_until_complete(self.broker.close())
+        super().tearDown()
+
+    @asyncio.coroutine
+    def callback(self, channel, body, envelope, properties):
+        self.deliveries.append(envelope.delivery_tag)
+
+    def settlements(self, method_id):
+        return [1 for channel, class_id, method in self.broker.methods
+                if (channel, class_id, method) == (self.channel.channel_id, amqp_constants.CLASS_BASIC, method_id)]
+
+    @testing.coroutine
+    def test_requeued(self):
+        yield from self.channel.basic_consume(self.callback, 'queue', consumer_tag='ctag', ack_timeout=0.05)
+        connection = self.broker.connections[0]
+        connection.deliver(self.channel.channel_id, 'ctag', 1, b'slow')
+        connection.deliver(self.channel.channel_id, 'ctag', 2, b'fast')
+        while len(self.deliveries) < 2:
+            yield from asyncio.sleep(0.01, loop=self.loop)
+        yield from self.channel.basic_client_ack(2)
+        yield from asyncio.sleep(0.15, loop=self.loop)
+        self.assertEqual(len(self.settlements(amqp_constants.BASIC_REJECT)), 1)
+        self.assertEqual(len(self.protocol._timer_wheel), 0)
+
+        # the late acknowledgement is dropped
+        yield from self.channel.basic_client_ack(1)
+        yield from asyncio.sleep(0.02, loop=self.loop)
+        self.assertEqual(len(self.settlements(amqp_constants.BASIC_ACK)), 1)
+
+    def test_no_ack(self):
+        with self.assertRaises(ValueError):
+            self.loop.run_until_complete(
+                self.channel.basic_consume(self.callback, 'queue', no_ack=True, ack_timeout=1))
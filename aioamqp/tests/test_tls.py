@@ -0,0 +1,71 @@
+"""
+    Tests the TLS contexts and sessions
+"""
+
+import ssl
+import unittest
+from unittest import mock
+
+from .. import tls
+
+
+class DefaultContextTestCase(unittest.TestCase):
+
+    def test_created_once(self):
+        context = tls.default_context()
+        self.assertIs(tls.default_context(), context)
+        self.assertTrue(context.check_hostname)
+        self.assertEqual(context.verify_mode, ssl.CERT_REQUIRED)
+
+    def test_not_verified(self):
+        context = tls.default_context(verify_ssl=False)
+        self.assertIsNot(context, tls.default_context(verify_ssl=True))
+        self.assertFalse(context.check_hostname)
+        self.assertEqual(context.verify_mode, ssl.CERT_NONE)
+
+
+@unittest.skipIf(not hasattr(ssl, 'PROTOCOL_TLS_CLIENT'), 'TLS sessions need Python 3.6 or later')
+class SessionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.context = tls.SessionResumingContext(ssl.PROTOCOL_TLS_CLIENT)
+        self.context.check_hostname = False
+        self.context.verify_mode = ssl.CERT_NONE
+
+    def test_save_session(self):
+        transport = mock.Mock()
+        ssl_object = transport.get_extra_info.return_value
+        ssl_object.session = session = object()
+        ssl_object.context = self.context
+        tls.save_session(transport, 'example.com', 5671)
+        self.assertIs(self.context.sessions[('example.com', 5671)], session)
+
+    def test_session_kept(self):
+        session = object()
+        self.context.sessions[('example.com', 5671)] = session
+        with mock.patch.object(ssl.SSLContext, 'wrap_bio') as wrap_bio:
+            # the connections opened together all resume the session
+            for _ in range(2):
+                context = tls.prepare_session(self.context, 'example.com', 5671)
+                context.wrap_bio(ssl.MemoryBIO(), ssl.MemoryBIO(), server_hostname='example.com')
+                self.assertIs(wrap_bio.call_args[1]['session'], session)
+            # not the session of another port
+            context = tls.prepare_session(self.context, 'example.com', 5672)
+            context.wrap_bio(ssl.MemoryBIO(), ssl.MemoryBIO(), server_hostname='example.com')
+            self.assertIsNone(wrap_bio.call_args[1]['session'])
+
+    def test_concurrent_connections(self):
+        session = object()
+        self.context.sessions[('example.com', 5671)] = session
+        with mock.patch.object(ssl.SSLContext, 'wrap_bio') as wrap_bio:
+            # the handshakes may happen in any order
+            context_5671 = tls.prepare_session(self.context, 'example.com', 5671)
+            context_5672 = tls.prepare_session(self.context, 'example.com', 5672)
+            context_5671.wrap_bio(ssl.MemoryBIO(), ssl.MemoryBIO(), server_hostname='example.com')
+            self.assertIs(wrap_bio.call_args[1]['session'], session)
+            context_5672.wrap_bio(ssl.MemoryBIO(), ssl.MemoryBIO(), server_hostname='example.com')
+            self.assertIsNone(wrap_bio.call_args[1]['session'])
+
+    def test_other_context_unchanged(self):
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        self.assertIs(tls.prepare_session(context, 'example.com', 5671), context)
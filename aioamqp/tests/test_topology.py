@@ -0,0 +1,111 @@
+"""
+    Tests the topology cache
+"""
+
+import unittest
+from unittest import mock
+
+from . import testcase
+from . import testing
+from .. import exceptions
+from ..topology import TopologyCache
+
+
+class TopologyCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = TopologyCache()
+
+    def test_exchange(self):
+        self.cache.add_exchange('e', 'direct', True, False, None)
+        self.assertTrue(self.cache.has_exchange('e', 'direct', True, False, {}))
+        self.assertFalse(self.cache.has_exchange('e', 'fanout', True, False, {}))
+        self.assertFalse(self.cache.has_exchange('e', 'direct', False, False, {}))
+        self.assertFalse(self.cache.has_exchange('e', 'direct', True, False, {'alternate-exchange': 'ae'}))
+
+    def test_queue_arguments_order(self):
+        results = {'queue': 'q', 'message_count': 0, 'consumer_count': 0}
+        self.cache.add_queue('q', True, False, False, {'x-max-priority': 4, 'x-message-ttl': 10}, results)
+        self.assertEqual(
+            self.cache.get_queue('q', True, False, False, {'x-message-ttl': 10, 'x-max-priority': 4}),
+            results)
+        self.assertIsNone(self.cache.get_queue('q', True, False, False, {'x-max-priority': 4}))
+
+    def test_remove_queue_drops_its_bindings(self):
+        self.cache.add_queue('q', False, False, False, None, {'queue': 'q'})
+        self.cache.add_binding('queue', 'q', 'e', 'rk', None)
+        self.cache.add_binding('queue', 'other', 'e', 'rk', None)
+        self.cache.remove_queue('q')
+        self.assertIsNone(self.cache.get_queue('q', False, False, False, None))
+        self.assertFalse(self.cache.has_binding('queue', 'q', 'e', 'rk', None))
+        self.assertTrue(self.cache.has_binding('queue', 'other', 'e', 'rk', None))
+
+    def test_remove_exchange_drops_its_bindings(self):
+        self.cache.add_exchange('e', 'topic', False, False, None)
+        self.cache.add_binding('queue', 'q', 'e', 'rk', None)
+        self.cache.add_binding('exchange', 'e', 'upstream', 'rk', None)
+        self.cache.add_binding('queue', 'q', 'other', 'rk', None)
+        self.cache.remove_exchange('e')
+        self.assertFalse(self.cache.has_exchange('e', 'topic', False, False, None))
+        self.assertEqual(self.cache.bindings, {('queue', 'q', 'other', 'rk', ())})
+
+    def test_remove_binding(self):
+        self.cache.add_binding('queue', 'q', 'e', 'rk', {'x-match': 'all'})
+        self.cache.remove_binding('queue', 'q', 'e', 'rk', {'x-match': 'all'})
+        self.assertFalse(self.cache.has_binding('queue', 'q', 'e', 'rk', {'x-match': 'all'}))
+
+
+class TopologyCacheChannelTestCase(testcase.RabbitTestCase, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        _transport, self.cached_amqp = self.loop.run_until_complete(self.create_amqp(topology_cache=True))
+        self.cached_channel = self.loop.run_until_complete(self.create_channel(amqp=self.cached_amqp))
+
+    @testing.coroutine
+    def test_repeated_declares_skip_the_wire(self):
+        yield from self.queue_declare('q', channel=self.cached_channel)
+        yield from self.exchange_declare('e', 'direct', channel=self.cached_channel)
+        yield from self.cached_channel.queue_bind('q', 'e', routing_key='rk')
+
+        with mock.patch.object(self.cached_channel, '_write_frame_awaiting_response') as write:
+            result = yield from self.cached_channel.queue_declare('q')
+            yield from self.cached_channel.exchange_declare('e', 'direct')
+            yield from self.cached_channel.queue_bind('q', 'e', routing_key='rk')
+        self.assertFalse(write.called)
+        self.assertEqual(result['queue'], self.full_name('q'))
+
+    @testing.coroutine
+    def test_delete_invalidates(self):
+        yield from self.queue_declare('q', channel=self.cached_channel)
+        yield from self.cached_channel.queue_delete('q')
+        result = yield from self.cached_channel.queue_declare('q')
+        self.assertEqual(result['message_count'], 0)
+        self.assertIn(self.full_name('q'), self.cached_amqp.topology_cache.queues)
+
+    @testing.coroutine
+    def test_channel_error_clears_cache(self):
+        yield from self.queue_declare('q', channel=self.cached_channel)
+        with self.assertRaises(exceptions.ChannelClosed):
+            yield from self.cached_channel.queue_declare('q', durable=True)
+        self.assertEqual(self.cached_amqp.topology_cache.queues, {})
+
+    @testing.coroutine
+    def test_closed_channel_raises(self):
+        yield from self.queue_declare('q', channel=self.cached_channel)
+        yield from self.exchange_declare('e', 'direct', channel=self.cached_channel)
+        yield from self.cached_channel.queue_bind('q', 'e', routing_key='rk')
+        yield from self.cached_channel.close()
+        with self.assertRaises(exceptions.ChannelClosed):
+            yield from self.cached_channel.queue_declare('q')
+        with self.assertRaises(exceptions.ChannelClosed):
+            yield from self.cached_channel.exchange_declare('e', 'direct')
+        with self.assertRaises(exceptions.ChannelClosed):
+            yield from self.cached_channel.queue_bind('q', 'e', routing_key='rk')
+
+    @testing.coroutine
+    def test_closed_connection_raises(self):
+        yield from self.queue_declare('q', channel=self.cached_channel)
+        yield from self.cached_amqp.close()
+        with self.assertRaises(exceptions.AmqpClosedConnection):
+            yield from self.cached_channel.queue_declare('q')
@@ -0,0 +1,42 @@
+"""
+    Tests the workers supervisor
+"""
+
+import os
+import unittest
+
+from ..workers import Supervisor, load_callback
+
+
+def _crashing_worker(worker_id, url, queues, prefetch, callback_path, stats_queue, stats_interval):
+    stats_queue.put((worker_id, os.getpid(), {'messages': 1, 'errors': 0}))
+    raise SystemExit(1)
+
+
+class CrashingSupervisor(Supervisor):
+    WORKER_TARGET = staticmethod(_crashing_worker)
+
+
+class LoadCallbackTestCase(unittest.TestCase):
+
+    def test_load_callback(self):
+        self.assertIs(load_callback('os.path:join'), os.path.join)
+        self.assertIs(load_callback('aioamqp.workers:Supervisor.run'), Supervisor.run)
+
+    def test_invalid_path(self):
+        with self.assertRaises(ValueError):
+            load_callback('os.path.join')
+
+
+class SupervisorTestCase(unittest.TestCase):
+
+    def test_crashed_workers_restarted(self):
+        supervisor = CrashingSupervisor(
+            'amqp://localhost/', ['queue'], 'os.path:join', workers=2, stats_interval=0.1, restart_delay=0.1)
+        supervisor.run(duration=1)
+
+        stats = supervisor.aggregated_stats()
+        self.assertGreaterEqual(supervisor.restarts, 2)
+        self.assertEqual(stats['workers'], 0)
+        # the counts of the crashed workers are kept
+        self.assertGreater(stats['messages'], 2)
@@ -56,6 +56,7 @@ class ProxyChannel(Channel):
     exchange_unbind = use_full_name(Channel.exchange_unbind, ['exchange_source', 'exchange_destination'])
     publish = use_full_name(Channel.publish, ['exchange_name'])
     basic_get = use_full_name(Channel.basic_get, ['queue_name'])
+    basic_get_many = use_full_name(Channel.basic_get_many, ['queue_name'])
     basic_consume = use_full_name(Channel.basic_consume, ['queue_name'])
 
     def full_name(self, name):
@@ -276,11 +277,11 @@ class RabbitTestCase(testing.AsyncioTestCaseMixin):
         return channel
 
     @asyncio.coroutine
-    def create_amqp(self, vhost=None):
+    def create_amqp(self, vhost=None, **kwargs):
         def protocol_factory(*args, **kw):
             return ProxyAmqpProtocol(self, *args, **kw)
         vhost = vhost or self.vhost
         transport, protocol = yield from aioamqp_connect(host=self.host, port=self.port, virtualhost=vhost,
-            protocol_factory=protocol_factory, loop=self.loop)
+            protocol_factory=protocol_factory, loop=self.loop, **kwargs)
         self.amqps.append(protocol)
         return transport, protocol
@@ -0,0 +1,116 @@
+"""
+    Hashed timer wheel for the timeouts of large numbers of pending operations
+"""
+
+import logging
+import math
+
+
+logger = logging.getLogger(__name__)
+
+
+class TimerHandle:
+    """A timer scheduled on a TimerWheel"""
+    __slots__ = ('_wheel', '_slot', '_rounds', '_callback', '_args', '_cancelled', '_fired')
+
+    def __init__(self, wheel, slot, rounds, callback, args):
+        self._wheel = wheel
+        self._slot = slot
+        self._rounds = rounds
+        self._callback = callback
+        self._args = args
+        self._cancelled = False
+        self._fired = False
+
+    def cancel(self):
+        if self._cancelled or self._fired:
+            return
+        self._cancelled = True
+        self._wheel._remove(self)
+
+    def cancelled(self):
+        return self._cancelled
+
+    def fired(self):
+        return self._fired
+
+
+class TimerWheel:
+    """Coarse timers, scheduled and cancelled in O(1)
+
+    The timers are hashed into `slots` buckets, one bucket is expired every
+    `resolution` seconds. A single loop callback ticks the wheel, and only
+    while timers are pending.
+    """
+
+    def __init__(self, loop, resolution=0.01, slots=512):
+        self._loop = loop
+        self.resolution = resolution
+        self._slots = [set() for _ in range(slots)]
+        self._cursor = 0
+        self._time = None   # the time of the slot under the cursor
+        self._count = 0
+        self._tick_handle = None
+
+    def __len__(self):
+        return self._count
+
+    def call_later(self, delay, callback, *args):
+        """Call `callback(*args)` in about `delay` seconds, never earlier"""
+        now = self._loop.time()
+        if self._tick_handle is None:
+            self._time = now
+        ticks = max(1, int(math.ceil((now - self._time + delay) / self.resolution)))
+        slot = (self._cursor + ticks) % len(self._slots)
+        handle = TimerHandle(self, slot, (ticks - 1) // len(self._slots), callback, args)
+        self._slots[slot].add(handle)
+        self._count += 1
+        if self._tick_handle is None:
+            self._tick_handle = self._loop.call_at(self._time + self.resolution, self._tick)
+        return handle
+
+    def clear(self):
+        """Cancel all the pending timers"""
+        for slot in self._slots:
+            for handle in slot:
+                handle._cancelled = True
+            slot.clear()
+        self._count = 0
+        if self._tick_handle is not None:
+            self._tick_handle.cancel()
+            self._tick_handle = None
+
+    def _remove(self, handle):
+        bucket = self._slots[handle._slot]
+        if handle in bucket:
+            bucket.discard(handle)
+            self._count -= 1
+
+    def _tick(self):
+        self._tick_handle = None
+        # catch up with the ticks missed by a busy loop
+        elapsed = max(1, int((self._loop.time() - self._time) / self.resolution))
+        for _ in range(elapsed):
+            self._cursor = (self._cursor + 1) % len(self._slots)
+            self._time += self.resolution
+            self._expire(self._slots[self._cursor])
+            if not self._count:
+                break
+        if self._count:
+            self._tick_handle = self._loop.call_at(self._time + self.resolution, self._tick)
+
+    def _expire(self, bucket):
+        expired = []
+        for handle in bucket:
+            if handle._rounds:
+                handle._rounds -= 1
+            else:
+                expired.append(handle)
+        for handle in expired:
+            bucket.discard(handle)
+            self._count -= 1
+            handle._fired = True
+            try:
+                handle._callback(*handle._args)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Error in timer callback %r", handle._callback)
@@ -0,0 +1,90 @@
+"""
+    TLS contexts shared by the connections, and TLS session resumption
+"""
+
+import logging
+import ssl
+
+
+logger = logging.getLogger(__name__)
+
+# verify_ssl -> the default context of the process
+_default_contexts = {}
+
+
+class SessionResumingContext(ssl.SSLContext):
+    """SSLContext resuming the TLS session of the last connection to the same endpoint
+
+    asyncio doesn't let the caller give a session to the handshake: each
+    connection is given a `context.for_endpoint(host, port)` proxy instead, whose
+    `wrap_bio()` passes the session. A session is kept until the next connection
+    to its endpoint replaces it: the connections opened together, by a pool, all
+    resume it.
+    """
+
+    @property
+    def sessions(self):
+        """(host, port) -> the TLS session of the last connection to the endpoint"""
+        # SSLContext.__init__ differs across python versions, don't override it
+        return self.__dict__.setdefault('_sessions', {})
+
+    def for_endpoint(self, host, port):
+        """Returns the context to give to asyncio for a connection to the endpoint"""
+        return _EndpointContext(self, host, port)
+
+
+class _EndpointContext:
+    """The context of one connection, `wrap_bio()` only gets the host from asyncio"""
+
+    def __init__(self, context, host, port):
+        self._context = context
+        self._endpoint = (host, port)
+
+    def __getattr__(self, name):
+        return getattr(self._context, name)
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        if session is None and not server_side:
+            session = self._context.sessions.get(self._endpoint)
+        return self._context.wrap_bio(
+            incoming, outgoing, server_side=server_side, server_hostname=server_hostname, session=session)
+
+
+def default_context(verify_ssl=True):
+    """Returns the context used when `ssl=True`, created once per process"""
+    context = _default_contexts.get(verify_ssl)
+    if context is not None:
+        return context
+    if hasattr(ssl, 'PROTOCOL_TLS_CLIENT'):
+        # python 3.6+: PROTOCOL_TLS_CLIENT checks the certificate and the hostname,
+        # against the CA certificates ssl.create_default_context() loads too
+        context = SessionResumingContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.load_default_certs(ssl.Purpose.SERVER_AUTH)
+    else:
+        context = ssl.create_default_context()
+    if not verify_ssl:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    _default_contexts[verify_ssl] = context
+    return context
+
+
+def prepare_session(context, host, port):
+    """Returns the context of a connection to the endpoint, resuming its last TLS session"""
+    if isinstance(context, SessionResumingContext):
+        return context.for_endpoint(host, port)
+    return context
+
+
+def save_session(transport, host, port):
+    """Remember the TLS session of an established connection, in its context
+
+    A session can only be resumed by a connection using the same context.
+    """
+    ssl_object = transport.get_extra_info('ssl_object')
+    session = getattr(ssl_object, 'session', None)
+    context = getattr(ssl_object, 'context', None)
+    if session is None or not isinstance(context, SessionResumingContext):
+        return
+    logger.debug("TLS session to %s:%s %s", host, port, 'resumed' if ssl_object.session_reused else 'created')
+    context.sessions[(host, port)] = session
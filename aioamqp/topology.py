@@ -0,0 +1,80 @@
+"""
+    Per-connection cache of the topology declared on the broker
+"""
+
+
+def _freeze(value):
+    """Turn AMQP arguments into something hashable"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _arguments_key(arguments):
+    return _freeze(arguments or {})
+
+
+class TopologyCache:
+    """Remember the declarations and bindings acknowledged by the broker
+
+    An identical declaration (same name, flags and arguments) found in the
+    cache doesn't need to go through the wire again.
+    """
+
+    def __init__(self):
+        self.exchanges = {}
+        self.queues = {}
+        self.bindings = set()
+
+    def clear(self):
+        self.exchanges.clear()
+        self.queues.clear()
+        self.bindings.clear()
+
+    def has_exchange(self, exchange_name, type_name, durable, auto_delete, arguments):
+        key = (type_name, durable, auto_delete, _arguments_key(arguments))
+        return self.exchanges.get(exchange_name) == key
+
+    def add_exchange(self, exchange_name, type_name, durable, auto_delete, arguments):
+        self.exchanges[exchange_name] = (type_name, durable, auto_delete, _arguments_key(arguments))
+
+    def remove_exchange(self, exchange_name):
+        self.exchanges.pop(exchange_name, None)
+        self.bindings = set(
+            binding for binding in self.bindings
+            if binding[2] != exchange_name and not (binding[0] == 'exchange' and binding[1] == exchange_name)
+        )
+
+    def get_queue(self, queue_name, durable, exclusive, auto_delete, arguments):
+        """Returns the cached declare-ok results, or None"""
+        key = (durable, exclusive, auto_delete, _arguments_key(arguments))
+        cached = self.queues.get(queue_name)
+        if cached is None or cached[0] != key:
+            return None
+        return dict(cached[1])
+
+    def add_queue(self, queue_name, durable, exclusive, auto_delete, arguments, results):
+        key = (durable, exclusive, auto_delete, _arguments_key(arguments))
+        self.queues[queue_name] = (key, results)
+
+    def remove_queue(self, queue_name):
+        self.queues.pop(queue_name, None)
+        self.bindings = set(
+            binding for binding in self.bindings
+            if not (binding[0] == 'queue' and binding[1] == queue_name)
+        )
+
+    @staticmethod
+    def _binding(kind, destination, source, routing_key, arguments):
+        return (kind, destination, source, routing_key, _arguments_key(arguments))
+
+    def has_binding(self, kind, destination, source, routing_key, arguments):
+        return self._binding(kind, destination, source, routing_key, arguments) in self.bindings
+
+    def add_binding(self, kind, destination, source, routing_key, arguments):
+        self.bindings.add(self._binding(kind, destination, source, routing_key, arguments))
+
+    def remove_binding(self, kind, destination, source, routing_key, arguments):
+        self.bindings.discard(self._binding(kind, destination, source, routing_key, arguments))